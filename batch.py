@@ -0,0 +1,317 @@
+"""
+Headless batch generator.
+
+Reads a manifest of (source_url, nap_item_number, mode) rows and writes one
+HTML file per row, without going through the Streamlit UI.
+
+    python batch.py manifest.csv --out-dir output --fetch-workers 8 --cpu-workers 4
+
+The manifest is either a CSV file with a header row or an NDJSON file
+(.ndjson / .jsonl) with one object per line. The mode column is optional and
+defaults to --mode, which by default detects each source's format ("Auto").
+
+Refresh runs are incremental: with the listing store enabled, a listing whose
+description iframe and image list hash the same as on the last run is not
+parsed again, and its page is only re-rendered when the template or rendering
+code changed or the page file is missing. The run reports which listings
+changed and why (--force regenerates everything).
+"""
+import argparse
+import csv
+import io
+import json
+import logging
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import http_client
+import listing_store
+import metrics
+import page_cache
+from generator import (AUTO_MODE, MODES, changed_inputs, fetch_listing_sources, input_hashes,
+                       render_fingerprint, render_hash)
+from render_pool import RenderPool, TaskTimeout
+
+# ==========================================
+# 1. MANIFEST
+# ==========================================
+
+def read_manifest(path, default_mode=AUTO_MODE):
+    """
+    Returns the manifest rows as dicts with source_url, nap_item_number and mode.
+    """
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        return parse_manifest(f.read(), path, default_mode)
+
+def parse_manifest(text, name, default_mode=AUTO_MODE):
+    """
+    read_manifest for manifest text (e.g. an upload); name tells CSV from NDJSON.
+    """
+    if name.lower().endswith((".ndjson", ".jsonl")):
+        raw_rows = [json.loads(line) for line in text.splitlines() if line.strip()]
+    else:
+        raw_rows = list(csv.DictReader(io.StringIO(text, newline="")))
+    return _manifest_rows(raw_rows, name, default_mode)
+
+def parse_listing_lines(text, default_mode=AUTO_MODE):
+    """
+    Rows from pasted lines of "source_url, nap_item_number[, mode]" (commas or
+    tabs; plain whitespace works when there is no mode). Blank lines are skipped.
+    """
+    raw_rows = []
+    for line in text.splitlines():
+        if not line.strip(): continue
+        if "," in line or "\t" in line:
+            fields = next(csv.reader([line], delimiter="\t" if "\t" in line else ","))
+        else:
+            fields = line.split()
+        raw_rows.append(dict(zip(("source_url", "nap_item_number", "mode"), fields)))
+    return _manifest_rows(raw_rows, "pasted list", default_mode)
+
+def _manifest_rows(raw_rows, name, default_mode):
+    rows = []
+    for line_no, raw in enumerate(raw_rows, start=1):
+        source_url = (raw.get("source_url") or "").strip()
+        nap_item_number = str(raw.get("nap_item_number") or "").strip()
+        mode = (raw.get("mode") or "").strip() or default_mode
+        if not source_url or not nap_item_number:
+            raise ValueError(f"{name}: row {line_no} needs both source_url and nap_item_number")
+        if mode != AUTO_MODE and mode not in MODES:
+            raise ValueError(f"{name}: row {line_no} has unknown mode {mode!r}")
+        rows.append({"source_url": source_url, "nap_item_number": nap_item_number, "mode": mode})
+    return rows
+
+# ==========================================
+# 2. FETCH (threads) / RENDER (processes, see render_pool)
+# ==========================================
+
+def fetch_row(row, verify_images=True):
+    """
+    Returns (data_html, images, fetch metrics dict, failure); failure is the
+    http_client.FetchFailure that stopped the fetch, or None.
+    """
+    data_html, images, failure = None, None, None
+    with metrics.run(emit=False) as run_metrics:
+        try:
+            data_html, images = fetch_listing_sources(row["source_url"], row["nap_item_number"], verify_images)
+        except http_client.FetchFailure as e:
+            failure = e
+            metrics.count(f"fetch.{e.kind}")
+    return data_html, images, run_metrics.to_dict(), failure
+
+def iter_batch(rows, pool, out_dir, fetch_workers=8, verify_images=True, store=None, fingerprint=None, force=False,
+               cancel=None, record_renders=True):
+    """
+    Fetches rows concurrently and hands each one to the RenderPool as soon as
+    its pages arrive. Yields (row, status, detail, metrics record) in completion
+    order; status is "ok" (detail = output path), "unchanged" (same, nothing
+    written), a fetch failure kind ("timeout", "blocked", "not_found",
+    "parse_miss", "fetch_error"; see http_client), "render_timeout" or
+    "render_error". Rendered and unchanged rows list what changed under "changes";
+    a fetch that crashed outright has no record.
+
+    The extracted listing records are saved to store (a ListingStore) if given,
+    along with the hashes of the fetched pages and each page's render hash under
+    fingerprint (see rerender.py). When the fetched pages hash the same as last
+    time, the stored record is reused instead of parsing them again, and the page
+    is only rendered if the template or code changed (unless force is set).
+    Without record_renders the pages' render hashes are not stored (for pages
+    written to a temporary directory).
+
+    Once cancel (a threading.Event) is set, or the generator is closed, queued
+    fetches are dropped and nothing more is rendered; only the fetches in
+    flight are waited for.
+    """
+    fetch_pool = ThreadPoolExecutor(max_workers=fetch_workers)
+    try:
+        fetches = {fetch_pool.submit(fetch_row, row, verify_images): row for row in rows}
+        renders = {}
+        pending = set(fetches)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            if cancel is not None and cancel.is_set(): return
+            for fut in done:
+                if fut in fetches:
+                    row = fetches.pop(fut)
+                    try:
+                        data_html, images, fetch_record, failure = fut.result()
+                    except Exception as e:
+                        yield row, "fetch_error", f"fetch error: {e}", None
+                        continue
+                    if failure is not None:
+                        yield row, failure.kind, str(failure), fetch_record
+                        continue
+                    out_path = os.path.join(out_dir, f"{row['nap_item_number']}.html")
+                    hashes = input_hashes(data_html, images, row["mode"])
+                    listing = None
+                    if store is not None:
+                        changes = changed_inputs(store.input_hashes(row["source_url"], row["nap_item_number"]), hashes)
+                        if not changes and force: changes = ["forced"]
+                        elif not changes:
+                            listing = store.get(row["source_url"], row["nap_item_number"])
+                            if listing is None: changes = ["new"]
+                    else:
+                        changes = ["new"]
+                    fetch_record["changes"] = changes
+
+                    if listing is not None:
+                        # Same supplier content: no parse, and no render unless the template / code changed
+                        store.put_input_hashes(row["source_url"], row["nap_item_number"], hashes, changed=False)
+                        if not os.path.exists(out_path):
+                            fetch_record["changes"] = ["missing_output"]
+                        elif store.render_hash(out_path) == render_hash(fingerprint, listing):
+                            yield row, "unchanged", out_path, fetch_record
+                            continue
+                        else:
+                            fetch_record["changes"] = ["template"]
+                        render = pool.render_record_file(out_path, listing)
+                    else:
+                        render = pool.render_file(out_path, data_html, images, row["mode"],
+                                                  row["source_url"], row["nap_item_number"])
+                    renders[render] = (row, fetch_record, listing, hashes)
+                    pending.add(render)
+                else:
+                    row, record, listing, hashes = renders.pop(fut)
+                    extracted = listing is None
+                    try:
+                        if extracted:
+                            out_path, listing, render_record = fut.result()
+                        else:
+                            out_path, render_record = fut.result()
+                    except TaskTimeout as e:
+                        yield row, "render_timeout", f"render timeout: {e}", record
+                        continue
+                    except Exception as e:
+                        yield row, "render_error", f"render error: {e}", record
+                        continue
+                    if store is not None:
+                        if extracted:
+                            store.put(listing)
+                            store.put_input_hashes(row["source_url"], row["nap_item_number"], hashes)
+                        if record_renders: store.put_render(out_path, listing, render_hash(fingerprint, listing))
+                    record["stages"].extend(render_record["stages"])
+                    for name, n in render_record["counters"].items():
+                        record["counters"][name] = record["counters"].get(name, 0) + n
+                    yield row, "ok", out_path, record
+    finally:
+        fetch_pool.shutdown(cancel_futures=True)
+
+def run_batch(rows, template_path, out_dir, fetch_workers=8, cpu_workers=None, prune_css=False,
+              verify_images=True, task_timeout=None, max_tasks_per_child=None, store=None, force=False,
+              log=print):
+    """
+    Runs iter_batch on a RenderPool of cpu_workers processes. Every row's fetch +
+    render metrics are logged as one JSON line on the nap.metrics logger as
+    soon as it finishes, and each listing whose inputs changed is reported.
+    Returns (written_paths, failures, metrics summary); the summary's "changes"
+    counts the listings per changed input, "unchanged" the skipped ones and
+    "failures" the failed ones per status.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    written, failures, records, unchanged = [], [], [], []
+    changes, failure_kinds = {}, {}
+    with open(template_path, "r", encoding="utf-8") as f:
+        fingerprint = render_fingerprint(f.read(), prune_css)
+
+    with RenderPool(template_path, workers=cpu_workers, task_timeout=task_timeout,
+                    max_tasks_per_child=max_tasks_per_child, prune_css=prune_css) as pool:
+        for row, status, detail, record in iter_batch(rows, pool, out_dir, fetch_workers, verify_images,
+                                                         store, fingerprint, force):
+            if status == "ok": written.append(detail)
+            elif status == "unchanged": unchanged.append(detail)
+            else:
+                failures.append((row, detail))
+                failure_kinds[status] = failure_kinds.get(status, 0) + 1
+            if record is None: continue
+            if status == "ok" and store is not None:
+                log(f"CHANGED {row['nap_item_number']} ({row['source_url']}): {', '.join(record['changes'])}")
+                for name in record["changes"]:
+                    changes[name] = changes.get(name, 0) + 1
+            record.update(source_url=row["source_url"], nap_item_number=row["nap_item_number"],
+                          mode=row["mode"], status=status)
+            record["total_ms"] = round(sum(s["ms"] for s in record["stages"]), 3)
+            records.append(record)
+            metrics.emit_record(record)
+
+    for row, reason in failures:
+        log(f"FAILED {row['nap_item_number']} ({row['source_url']}): {reason}")
+    summary = metrics.aggregate(records)
+    summary.update(changes=changes, unchanged=len(unchanged), failures=failure_kinds)
+    log(f"Done: {len(written)} written, {len(unchanged)} unchanged, {len(failures)} failed.")
+    if failure_kinds:
+        log("Failures: " + ", ".join(f"{kind}={n}" for kind, n in sorted(failure_kinds.items())))
+    if changes:
+        log("Changed inputs: " + ", ".join(f"{name}={n}" for name, n in sorted(changes.items())))
+    log("Stage totals: " + ", ".join(f"{name} {agg['ms'] / 1000:.2f}s" for name, agg in summary["stages"].items()))
+    if summary["counters"]:
+        log("Counters: " + ", ".join(f"{name}={n}" for name, n in sorted(summary["counters"].items())))
+    return written, failures, summary
+
+# ==========================================
+# 3. CLI
+# ==========================================
+
+def rate_limit(spec):
+    """
+    Parses HOST=RPS[/BURST] into (host, (rate, burst)); the burst defaults to twice the rate.
+    """
+    host, _, value = spec.partition("=")
+    rate, _, burst = value.partition("/")
+    try:
+        rate, burst = float(rate), float(burst) if burst else float(rate) * 2
+    except ValueError:
+        rate = 0
+    if not host or rate <= 0 or burst < 1:
+        raise argparse.ArgumentTypeError(f"expected HOST=RPS[/BURST], got {spec!r}")
+    return host.strip(), (rate, burst)
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Generate listing HTML files from a CSV/NDJSON manifest.")
+    parser.add_argument("manifest", help="CSV (with header) or NDJSON file with source_url, nap_item_number[, mode]")
+    parser.add_argument("--out-dir", default="output", help="Directory for the generated <nap_item_number>.html files")
+    parser.add_argument("--template", default="template.html", help="Path to template.html")
+    parser.add_argument("--mode", default=AUTO_MODE, choices=[AUTO_MODE] + MODES,
+                        help="Mode for rows that do not set one (default: detect the source format)")
+    parser.add_argument("--fetch-workers", type=int, default=8, help="Concurrent page fetches")
+    parser.add_argument("--cpu-workers", type=int, default=None, help="Render processes (default: CPU count)")
+    parser.add_argument("--task-timeout", type=float, default=None, help="Seconds a single render may take before it fails")
+    parser.add_argument("--max-tasks-per-child", type=int, default=None, help="Restart each render process after this many listings")
+    parser.add_argument("--cache-dir", default=page_cache.DEFAULT_DIR, help="On-disk page cache directory")
+    parser.add_argument("--cache-max-mb", type=int, default=page_cache.DEFAULT_MAX_BYTES // (1024 * 1024), help="Page cache byte budget (MB)")
+    parser.add_argument("--no-cache", action="store_true", help="Always fetch pages from the network")
+    parser.add_argument("--max-retries", type=int, default=http_client.DEFAULT_MAX_RETRIES,
+                        help="Retries per request on timeouts, dropped connections and 429/5xx answers")
+    parser.add_argument("--rate-limit", action="append", default=[], type=rate_limit, metavar="HOST=RPS[/BURST]",
+                        help="Requests per second for a host suffix, e.g. ebay.com=2/4 (repeatable)")
+    parser.add_argument("--no-verify-images", action="store_true", help="Do not check that gallery image sizes exist")
+    parser.add_argument("--prune-css", action="store_true", help="Leave out template CSS rules the listings cannot use")
+    parser.add_argument("--store-dir", default=listing_store.DEFAULT_DIR, help="Where extracted listing records are kept")
+    parser.add_argument("--no-store", action="store_true", help="Do not keep the extracted listing records")
+    parser.add_argument("--force", action="store_true",
+                        help="Parse and render every listing, even when its pages and the template are unchanged")
+    parser.add_argument("--metrics-log", help="Append per-listing metrics (JSON lines) to this file")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    rows = read_manifest(args.manifest, default_mode=args.mode)
+    # Each row fetch runs its image lookup on the shared pool, so size it to match
+    http_client.configure(pool_size=max(args.fetch_workers, 1) * 2, max_retries=args.max_retries,
+                          rate_limits=dict(args.rate_limit))
+    page_cache.configure(enabled=not args.no_cache, path=args.cache_dir, max_bytes=args.cache_max_mb * 1024 * 1024)
+    if args.metrics_log:
+        handler = logging.FileHandler(args.metrics_log, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        metrics.logger.addHandler(handler)
+        metrics.logger.setLevel(logging.INFO)
+    _, failures, _ = run_batch(rows, args.template, args.out_dir,
+                            fetch_workers=args.fetch_workers, cpu_workers=args.cpu_workers, prune_css=args.prune_css,
+                            verify_images=not args.no_verify_images, task_timeout=args.task_timeout,
+                            max_tasks_per_child=args.max_tasks_per_child,
+                            store=None if args.no_store else listing_store.ListingStore(args.store_dir),
+                            force=args.force)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+"""
+End-to-end load test against the local mock eBay server.
+
+    python bench/load_test.py -n 200 -c 16
+    python bench/load_test.py -n 500 -c 32 --latency-ms 80 --error-rate 0.02 --throttle-rps 150
+    python bench/load_test.py --server http://127.0.0.1:8765   # a mock_ebay.py started separately
+
+Runs n generations with c of them in flight. Each one fetches the item page,
+description iframe and NAP image grid through fetch_url_standard (page cache
+off, so every request goes through the rate limiter / retries / breaker of
+http_client) and merges them with merge_all_data, in the driver threads or
+on a RenderPool (--render-workers). Reports throughput, p50/p95/p99 latency,
+failures by kind, the fetch-layer counters and memory (peak RSS; --trace-memory
+adds the traced Python heap peak at a noticeable slowdown).
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import generator
+import http_client
+import metrics
+import page_cache
+from mock_ebay import MockEbay, add_server_arguments
+from render_pool import RenderPool
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(BENCH_DIR), "template.html")
+
+def percentile(sorted_values, p):
+    """
+    Nearest-rank percentile of an ascending list (None when empty).
+    """
+    if not sorted_values: return None
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+def rss_kb():
+    """
+    Current resident set size, where /proc is available.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError, IndexError):
+        return None
+
+# ==========================================
+# 1. ONE GENERATION
+# ==========================================
+
+def generate(server_url, item_id, mode, template, verify_images, pool):
+    """
+    Returns (seconds, status, metrics dict).
+    """
+    start = time.perf_counter()
+    status = "ok"
+    with metrics.run(emit=False) as run_metrics:
+        try:
+            data_html, images = generator.fetch_listing_sources(f"{server_url}/itm/{item_id}", item_id, verify_images)
+            if pool is not None:
+                pool.render_html(data_html, images, mode).result()
+            else:
+                generator.merge_all_data(template, data_html, images, mode=mode)
+        except http_client.FetchFailure as e:
+            status = e.kind
+        except Exception as e:
+            status = f"error: {type(e).__name__}"
+    return time.perf_counter() - start, status, run_metrics.to_dict()
+
+# ==========================================
+# 2. DRIVER
+# ==========================================
+
+def run_load(server_url, total, concurrency, mode, template, verify_images=False, pool=None, trace_memory=False):
+    results = []
+    lock = threading.Lock()
+    rss_start = rss_kb()
+    if trace_memory: tracemalloc.start()
+
+    def one(i):
+        outcome = generate(server_url, str(100000 + i), mode, template, verify_images, pool)
+        with lock:
+            results.append(outcome)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="load") as executor:
+        list(executor.map(one, range(total)))
+    elapsed = time.perf_counter() - started
+
+    traced_peak = None
+    if trace_memory:
+        traced_peak = tracemalloc.get_traced_memory()[1] // 1024
+        tracemalloc.stop()
+
+    latencies = sorted(seconds * 1000 for seconds, status, _ in results if status == "ok")
+    statuses = {}
+    for _, status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    summary = metrics.aggregate([record for _, _, record in results])
+    return {
+        "listings": total, "concurrency": concurrency, "seconds": round(elapsed, 3),
+        "throughput_per_s": round(statuses.get("ok", 0) / elapsed, 2) if elapsed else None,
+        "latency_ms": {name: round(percentile(latencies, p), 1) if latencies else None
+                       for name, p in (("p50", 50), ("p95", 95), ("p99", 99))},
+        "statuses": statuses, "counters": summary["counters"],
+        "memory_kb": {"rss_start": rss_start, "rss_end": rss_kb(),
+                      "rss_peak": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, "traced_peak": traced_peak},
+    }
+
+def print_report(report, server_stats=None):
+    latency = report["latency_ms"]
+    print(f"{report['listings']} listings, {report['concurrency']} in flight: {report['seconds']:.2f}s, "
+          f"{report['throughput_per_s']} listings/s")
+    print(f"latency ms: p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}")
+    print("statuses: " + ", ".join(f"{name}={n}" for name, n in sorted(report["statuses"].items())))
+    counters = {name: n for name, n in report["counters"].items() if name.startswith(("http.", "images."))}
+    if counters:
+        print("fetch layer: " + ", ".join(f"{name}={n}" for name, n in sorted(counters.items())))
+    if server_stats:
+        print("server: " + ", ".join(f"{name}={n}" for name, n in server_stats.items()))
+    memory = report["memory_kb"]
+    print(f"memory KB: rss start {memory['rss_start']}  end {memory['rss_end']}  peak {memory['rss_peak']}"
+          + (f"  traced peak {memory['traced_peak']}" if memory["traced_peak"] is not None else ""))
+
+# ==========================================
+# 3. CLI
+# ==========================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent end-to-end load test against a local mock of eBay.")
+    parser.add_argument("-n", "--listings", type=int, default=100, help="Generations to run")
+    parser.add_argument("-c", "--concurrency", type=int, default=8, help="Generations in flight")
+    parser.add_argument("--mode", default=generator.AUTO_MODE, choices=[generator.AUTO_MODE] + generator.MODES)
+    parser.add_argument("--server", help="Use a running mock_ebay.py instead of starting one in-process")
+    add_server_arguments(parser)
+    parser.add_argument("--render-workers", type=int, default=0, help="Merge on a RenderPool of this many processes")
+    parser.add_argument("--verify-images", action="store_true", help="Also probe the gallery images")
+    parser.add_argument("--client-rps", type=float, default=1000,
+                        help="http_client rate limit for the mock host (burst: a tenth of a second's worth)")
+    parser.add_argument("--max-retries", type=int, default=http_client.DEFAULT_MAX_RETRIES)
+    parser.add_argument("--breaker-cooldown", type=float, default=5, help="Seconds a throttled host is paused")
+    parser.add_argument("--trace-memory", action="store_true", help="Report the traced Python heap peak (slow)")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.server:
+        server_url = args.server.rstrip("/")
+    else:
+        server = MockEbay(0, args.latency_ms, args.error_rate, args.throttle_rate, args.throttle_rps,
+                          args.pathological).start()
+        server_url = server.url
+
+    page_cache.configure(enabled=False)
+    http_client.BREAKER_COOLDOWN = args.breaker_cooldown
+    host = server_url.split("://", 1)[-1].split("/", 1)[0].split(":", 1)[0]
+    # Each generation fetches the NAP page (and image probes) on the shared pool
+    http_client.configure(pool_size=max(args.concurrency, 1) * 2, max_retries=args.max_retries,
+                          rate_limits={host: (args.client_rps, max(args.client_rps / 10, 1))})
+    generator.EBAY_ITEM_URL = server_url + "/itm/{item_id}"
+    with open(TEMPLATE_PATH, encoding="utf-8") as f:
+        template = f.read()
+    for mode in generator.MODES:
+        generator.compile_template(template, mode)
+
+    pool = RenderPool(TEMPLATE_PATH, workers=args.render_workers) if args.render_workers else None
+    try:
+        report = run_load(server_url, args.listings, args.concurrency, args.mode, template,
+                          args.verify_images, pool, args.trace_memory)
+    finally:
+        if pool is not None: pool.shutdown()
+        if server is not None: server.stop()
+
+    print_report(report, server.stats if server else None)
+    if server is not None: report["server"] = server.stats
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0 if report["statuses"].get("ok") else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+"""
+Local stand-in for ebay.com and the description host.
+
+Serves the benchmark cases (bench/fixtures, optionally the generated
+pathological ones) as item pages and description iframes, so the fetch +
+merge pipeline can be load-tested without touching eBay:
+
+    python bench/mock_ebay.py --port 8765 --latency-ms 80 --error-rate 0.02 --throttle-rps 50
+
+Item ids map onto the cases round-robin (/itm/<id>). Each item page's
+iframe#desc_ifr points at /itmdesc/<case> on the same server, and its image
+grid at /img/..., which answers HEAD and ranged GETs. Every response can be
+delayed (latency with +-50% jitter), replaced by a 500 (error rate) or by a 429
+with Retry-After, either at random (throttle rate) or whenever the server-wide
+requests-per-second budget is spent (throttle rps).
+"""
+import argparse
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import run_bench
+
+IFRAME_SRC_RE = re.compile(r'(<iframe[^>]*\bid="desc_ifr"[^>]*\bsrc=")[^"]*(")')
+IMAGE_HOST = "https://i.ebayimg.com"
+# Smallest valid GIF; image probes only look at the status
+PIXEL = b"GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9\x04\x01\x00\x00\x00\x00,\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;"
+
+class MockEbay(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, latency_ms=0, error_rate=0.0, throttle_rate=0.0, throttle_rps=None,
+                 pathological=False, host="127.0.0.1"):
+        super().__init__((host, port), _Handler)
+        self.url = f"http://{host}:{self.server_address[1]}"
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.throttle_rps = throttle_rps
+        self.cases = run_bench.load_cases(pathological=pathological)
+        self.item_pages, self.descriptions = {}, {}
+        for name, mode, item_html, description_html in self.cases:
+            page = IFRAME_SRC_RE.sub(lambda m: f"{m.group(1)}{self.url}/itmdesc/{name}{m.group(2)}", item_html)
+            self.item_pages[name] = page.replace(IMAGE_HOST, f"{self.url}/img").encode("utf-8")
+            self.descriptions[name] = description_html.encode("utf-8")
+        self.stats = {"requests": 0, "errors": 0, "throttled": 0, "not_found": 0}
+        self._lock = threading.Lock()
+        self._window = (0, 0)  # (second, requests in it)
+        self._thread = None
+
+    def case_for(self, item_id):
+        """
+        Returns (name, mode) of the case served for an item id.
+        """
+        index = int(item_id) if item_id.isdigit() else sum(item_id.encode())
+        name, mode, _, _ = self.cases[index % len(self.cases)]
+        return name, mode
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="mock-ebay", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def handle_error(self, request, client_address):
+        # The streaming extractors stop reading item pages once they have what they need
+        if isinstance(sys.exc_info()[1], ConnectionError): return
+        super().handle_error(request, client_address)
+
+    def count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def over_budget(self):
+        if not self.throttle_rps: return False
+        now = int(time.monotonic())
+        with self._lock:
+            second, used = self._window
+            used = used + 1 if second == now else 1
+            self._window = (now, used)
+        return used > self.throttle_rps
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real hosts
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def _serve(self, send_body):
+        server = self.server
+        server.count("requests")
+        if server.latency_ms:
+            time.sleep(server.latency_ms * random.uniform(0.5, 1.5) / 1000)
+        if server.over_budget() or random.random() < server.throttle_rate:
+            server.count("throttled")
+            return self._reply(429, b"Too Many Requests", send_body, {"Retry-After": "1"})
+        if random.random() < server.error_rate:
+            server.count("errors")
+            return self._reply(500, b"Internal Server Error", send_body)
+
+        path = self.path.split("?", 1)[0]
+        body, content_type, status = None, "text/html; charset=utf-8", 200
+        if path.startswith("/itm/"):
+            name, _ = server.case_for(path[len("/itm/"):])
+            body = server.item_pages[name]
+        elif path.startswith("/itmdesc/"):
+            body = server.descriptions.get(path[len("/itmdesc/"):])
+        elif path.startswith("/img/"):
+            body, content_type = PIXEL, "image/gif"
+            if self.headers.get("Range"): body, status = PIXEL[:1], 206
+        if body is None:
+            server.count("not_found")
+            return self._reply(404, b"Not Found", send_body)
+        self._reply(status, body, send_body, {"Content-Type": content_type})
+
+    def _reply(self, status, body, send_body, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if send_body: self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Serve the bench cases as a local mock of eBay.")
+    add_server_arguments(parser)
+    parser.add_argument("--port", type=int, default=8765)
+    return parser
+
+def add_server_arguments(parser):
+    parser.add_argument("--latency-ms", type=float, default=0, help="Mean response delay (+-50%% jitter)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with a 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of requests answered with a 429")
+    parser.add_argument("--throttle-rps", type=int, default=None, help="Answer 429 beyond this many requests per second")
+    parser.add_argument("--pathological", action="store_true", help="Also serve the large generated cases")
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    server = MockEbay(args.port, args.latency_ms, args.error_rate, args.throttle_rate, args.throttle_rps,
+                      args.pathological)
+    print(f"Serving {len(server.cases)} cases on {server.url} (item pages at /itm/<id>); Ctrl+C to stop")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+"""
+Generated worst-case listings for the benchmark.
+
+These are built deterministically at run time instead of being stored, since
+they are large and only interesting for their shape: deep wrapper nesting,
+long feature lists and huge fitment tables.
+"""
+
+def _item_page(item_id, image_keys, filler_paragraphs=20000):
+    buttons = "".join(
+        f'<button class="ux-image-grid-item"><img src="https://i.ebayimg.com/images/g/{key}/s-l140.webp"></button>'
+        for key in image_keys)
+    filler = "<p>Similar sponsored items and recommendations.</p>" * filler_paragraphs
+    return (f'<html><head><script>var cfg = "<div>";</script></head><body>'
+            f'<div class="ux-image-grid">{buttons}</div>'
+            f'<iframe id="desc_ifr" src="https://vi.vipr.ebaydesc.com/itmdesc/{item_id}"></iframe>'
+            f'{filler}</body></html>')
+
+def xtreme_deep(depth=250, paragraphs=400, fitment=1500):
+    desc = ("<div>" * depth
+            + "".join(f"<div><h3>Feature {i}</h3><p>Detail line {i} for this part, with enough words to be a paragraph.</p>"
+                      f"<span>Note {i}</span></div>" for i in range(paragraphs))
+            + "</div>" * depth)
+    fits = "".join(f"<div>{2000 + i % 25} Toyota Model{i // 25} Trim{i % 7} Sedan 4-Door</div>" for i in range(fitment))
+    description = (f'<html><body><div class="title-name"><h2>Deeply nested Xtreme listing</h2></div>'
+                   f'<div class="desc-box">{desc}</div><div class="tableinfo"><table><tbody>'
+                   + "".join(f"<tr><td>Spec {i}</td><td>Value {i}</td></tr>" for i in range(40))
+                   + f'</tbody></table><div class="table-details"><p>First note</p></div>'
+                   f'<div class="table-details"><h6>Toyota</h6>{fits}</div></div></body></html>')
+    return "Xtreme", _item_page("110000000001", ["AAAAAeSwdeep0001", "AAAAAeSwdeep0002"]), description
+
+def carparts_deep(depth=250, blocks=300, fitment=1500):
+    body = ("<div>" * depth
+            + "".join(f"<div><p><strong>Block {i}</strong></p><p>Intro {i}</p><ul><li>Point {i}a â€“ fits</li>"
+                      f"<li>Point {i}b</li></ul><p>Paragraph {i} isnâ€™t short: it carries plenty of descriptive words.</p></div>"
+                      for i in range(blocks))
+            + "</div>" * depth)
+    fits = "".join(f"<li>{2000 + i % 25} Honda Model{i // 25} Trim{i % 7}</li>" for i in range(fitment))
+    description = (f'<html><body><div class="eb_title">Deeply nested Carparts listing</div>'
+                   f'<section id="content__right"><h2>Description</h2>{body}<section>end</section></section>'
+                   f'<div id="content__bottom"><table>'
+                   + "".join(f"<tr><td>Spec {i}</td><td>Value {i}</td></tr>" for i in range(40))
+                   + f'</table></div><div class="item__list"><div class="items__list--content"><p>Honda</p><ul>{fits}</ul>'
+                   f'</div></div></body></html>')
+    return "Carparts", _item_page("110000000002", ["AAAAAeSwdeep0003"]), description
+
+def ourstore_large_fitment(paragraphs=300, fitment=3000):
+    lines = "".join(f"<p>{2000 + i % 25} Ford Model{i // 25} Trim{i % 7}</p>" for i in range(fitment))
+    description = ('<html><body><div><span style="font-size: 28pt;">Our Store listing with a huge fitment table</span>'
+                   '<p>Warranty Coverage Policy</p>'
+                   + "".join(f'<p><span style="font-weight: 700;">Heading {i}</span></p><p>Body text {i}.</p>'
+                             for i in range(paragraphs))
+                   + '<p>Certification: DOT</p><p>Finish: Black</p><p><span>Part Link Number</span></p>'
+                   '<ul><li>FO1000001</li></ul><p>Compatible with the Following Vehicles</p>'
+                   '<ul><li><span style="font-size: 13pt;">Ford:</span></li></ul>'
+                   f'{lines}<p>Return &amp; Replacement Policy</p></div></body></html>')
+    return "Our Store", _item_page("110000000003", ["AAAAAeSwdeep0004"]), description
+
+CASES = {
+    "xtreme_deep": xtreme_deep,
+    "carparts_deep": carparts_deep,
+    "ourstore_large_fitment": ourstore_large_fitment,
+}
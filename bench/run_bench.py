@@ -0,0 +1,185 @@
+"""
+Offline benchmark for the extract + merge pipeline.
+
+Runs every case in bench/fixtures (item.html + description.html + case.json)
+and the generated worst cases in bench/pathological.py without touching the
+network. For each case it reports per-stage timings and the peak traced
+memory of one full merge, and diffs the generated HTML against
+bench/golden/<case>.html.
+
+    python bench/run_bench.py                 # run everything
+    python bench/run_bench.py -k carparts -n 10
+    python bench/run_bench.py --update-golden # accept the current output
+    python bench/run_bench.py --json results.json
+
+The exit code is non-zero when any output differs from its golden file or
+a case's format is not auto-detected as its declared mode.
+"""
+import argparse
+import difflib
+import hashlib
+import json
+import os
+import re
+import statistics
+import sys
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from bs4 import BeautifulSoup
+
+import generator
+import pathological as generated_cases
+
+FIXTURES_DIR = os.path.join(BENCH_DIR, "fixtures")
+GOLDEN_DIR = os.path.join(BENCH_DIR, "golden")
+TEMPLATE_PATH = os.path.join(os.path.dirname(BENCH_DIR), "template.html")
+
+STYLE_RE = re.compile(r"(<style>)(.*?)(</style>)", re.S)
+
+# ==========================================
+# 1. CASES
+# ==========================================
+
+def load_cases(pattern=None, pathological=True):
+    cases = []
+    for name in sorted(os.listdir(FIXTURES_DIR)):
+        case_dir = os.path.join(FIXTURES_DIR, name)
+        if not os.path.isdir(case_dir): continue
+        with open(os.path.join(case_dir, "case.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(os.path.join(case_dir, "item.html"), encoding="utf-8") as f:
+            item_html = f.read()
+        with open(os.path.join(case_dir, "description.html"), encoding="utf-8") as f:
+            description_html = f.read()
+        cases.append((name, meta["mode"], item_html, description_html))
+
+    for name, build in (generated_cases.CASES.items() if pathological else ()):
+        mode, item_html, description_html = build()
+        cases.append((name, mode, item_html, description_html))
+
+    if pattern:
+        cases = [c for c in cases if pattern in c[0]]
+    return cases
+
+def clean_stage(mode, data):
+    return generator.FORMATS[mode](data, BeautifulSoup("", "html.parser")).description()
+
+# ==========================================
+# 2. MEASUREMENT
+# ==========================================
+
+def timed(fn, repeat):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000, result
+
+def run_case(name, mode, item_html, description_html, template, repeat):
+    stages = {}
+    stages["item_page"], (iframe_url, images) = timed(
+        lambda: (generator.extract_iframe_url(item_html), generator.parse_images_from_html(item_html)[:6]), repeat)
+    stages["parse"], _ = timed(lambda: BeautifulSoup(description_html, "html.parser"), repeat)
+    # Cleaners mutate their input, so each run gets a fresh parse (timed separately above)
+    clean_samples = []
+    for _ in range(repeat):
+        data = BeautifulSoup(description_html, "html.parser")
+        start = time.perf_counter()
+        clean_stage(mode, data)
+        clean_samples.append(time.perf_counter() - start)
+    stages["clean"] = statistics.median(clean_samples) * 1000
+
+    generator.compile_template.cache_clear()
+    stages["compile"], _ = timed(lambda: generator.compile_template(template, mode), 1)
+    stages["merge"], output = timed(lambda: generator.merge_all_data(template, description_html, images, mode=mode), repeat)
+    # Re-render from a stored record: no parsing at all
+    record = generator.extract_record(description_html, images, mode)
+    stages["render"], _ = timed(lambda: generator.render_record(template, record), repeat)
+
+    tracemalloc.start()
+    generator.merge_all_data(template, description_html, images, mode=mode)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "case": name, "mode": mode, "stages_ms": stages, "peak_kb": peak // 1024,
+        "input_bytes": len(item_html) + len(description_html), "output_bytes": len(output),
+        "iframe_found": bool(iframe_url), "images": len(images),
+        "detected": generator.detect_format(description_html),
+    }, output
+
+# ==========================================
+# 3. GOLDEN FILES
+# ==========================================
+
+def normalize(output):
+    """
+    The template stylesheet is replaced by its hash so golden files stay small
+    and readable while CSS changes still show up as a diff.
+    """
+    def digest(m):
+        return f"{m.group(1)}/* sha256:{hashlib.sha256(m.group(2).encode('utf-8')).hexdigest()} */{m.group(3)}"
+    return STYLE_RE.sub(digest, output, count=1)
+
+def check_golden(name, output, update):
+    path = os.path.join(GOLDEN_DIR, f"{name}.html")
+    normalized = normalize(output)
+    if update or not os.path.exists(path):
+        os.makedirs(GOLDEN_DIR, exist_ok=True)
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            f.write(normalized)
+        return "written", []
+    with open(path, encoding="utf-8", newline="") as f:
+        expected = f.read()
+    if expected == normalized:
+        return "ok", []
+    diff = list(difflib.unified_diff(expected.splitlines(), normalized.splitlines(),
+                                     f"golden/{name}.html", "output", lineterm="", n=1))
+    return "DIFF", diff
+
+# ==========================================
+# 4. CLI
+# ==========================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark + golden-output check.")
+    parser.add_argument("-k", dest="pattern", help="Only run cases whose name contains this")
+    parser.add_argument("-n", "--repeat", type=int, default=5, help="Runs per stage (median is reported)")
+    parser.add_argument("--update-golden", action="store_true", help="Overwrite golden files with the current output")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    with open(TEMPLATE_PATH, encoding="utf-8") as f:
+        template = f.read()
+
+    results, failed = [], False
+    stage_names = ["item_page", "parse", "clean", "compile", "merge", "render"]
+    print(f"{'case':<24}{'mode':<11}" + "".join(f"{s + ' ms':>12}" for s in stage_names) + f"{'peak KB':>10}{'out KB':>9}  golden")
+    for name, mode, item_html, description_html in load_cases(args.pattern):
+        result, output = run_case(name, mode, item_html, description_html, template, args.repeat)
+        status, diff = check_golden(name, output, args.update_golden)
+        if result["detected"] != mode:
+            # Auto mode would have used a different extractor for this case
+            status = f"DETECTED {result['detected']}"
+            failed = True
+        result["golden"] = status
+        results.append(result)
+        print(f"{name:<24}{mode:<11}" + "".join(f"{result['stages_ms'][s]:>12.2f}" for s in stage_names)
+              + f"{result['peak_kb']:>10}{result['output_bytes'] // 1024:>9}  {status}")
+        if diff:
+            failed = True
+            print("\n".join(diff[:40]))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
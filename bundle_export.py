@@ -0,0 +1,116 @@
+"""
+Multi-listing export as a single zip archive.
+
+A BundleJob runs the batch pipeline (batch.iter_batch: concurrent fetches,
+RenderPool renders) on a background thread. Each page is copied into a zip in
+a temporary file as soon as it is finished and then deleted, so memory stays
+flat however many listings are exported. The archive ends with report.csv,
+listing every row's status. The Streamlit app polls progress() and offers
+the finished file for download.
+"""
+import csv
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+import weakref
+import zipfile
+
+from batch import iter_batch
+from generator import render_fingerprint
+from render_pool import RenderPool
+
+REPORT_NAME = "report.csv"
+
+class BundleJob:
+    def __init__(self, rows, template_str, prune_css=False, fetch_workers=4, cpu_workers=2, store=None):
+        self.rows = rows
+        self.template_str = template_str
+        self.prune_css = prune_css
+        self.fetch_workers = fetch_workers
+        self.cpu_workers = cpu_workers
+        self.store = store
+        self.results = []    # (row, status, detail) in completion order
+        self.error = None
+        self.finished = False
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="bundle-export", daemon=True)
+        self._dir = tempfile.mkdtemp(prefix="nap_bundle_")
+        self.zip_path = os.path.join(self._dir, "listings.zip")
+        # The temporary files go with the job, even if cleanup() is never called
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self._dir, True)
+
+    def start(self):
+        self.started_at = time.time()
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        """
+        Drops the queued listings and stops once the fetches and renders in flight
+        are done; the archive keeps what was finished.
+        """
+        self._cancel.set()
+
+    def cleanup(self):
+        self.cancel()
+        self._finalizer()
+
+    def progress(self):
+        """
+        Returns {"total", "done", "ok", "failed", "finished"} for progress displays.
+        """
+        with self._lock:
+            done = len(self.results)
+            ok = sum(1 for _, status, _ in self.results if status == "ok")
+        return {"total": len(self.rows), "done": done, "ok": ok, "failed": done - ok, "finished": self.finished}
+
+    def failures(self):
+        with self._lock:
+            return [(row, detail) for row, status, detail in self.results if status != "ok"]
+
+    def _run(self):
+        pages_dir = os.path.join(self._dir, "pages")
+        template_path = os.path.join(self._dir, "template.html")
+        try:
+            with open(template_path, "w", encoding="utf-8") as f:
+                f.write(self.template_str)
+            fingerprint = render_fingerprint(self.template_str, self.prune_css)
+            os.makedirs(pages_dir, exist_ok=True)
+            with zipfile.ZipFile(self.zip_path, "w", zipfile.ZIP_DEFLATED) as archive, \
+                 RenderPool(template_path, workers=self.cpu_workers, prune_css=self.prune_css) as pool:
+                written = set()
+                for row, status, detail, _ in iter_batch(self.rows, pool, pages_dir, self.fetch_workers,
+                                                         store=self.store, fingerprint=fingerprint,
+                                                         cancel=self._cancel, record_renders=False):
+                    if status in ("ok", "unchanged") and os.path.exists(detail):
+                        name = os.path.basename(detail)
+                        if name not in written: archive.write(detail, name)  # Streamed in chunks
+                        written.add(name)
+                        os.remove(detail)
+                        status, detail = "ok", name
+                    with self._lock:
+                        self.results.append((row, status, detail))
+                    if self._cancel.is_set(): break
+                if self._cancel.is_set(): pool.shutdown(cancel_futures=True)
+                archive.writestr(REPORT_NAME, self._report())
+        except Exception as e:
+            self.error = e
+        finally:
+            shutil.rmtree(pages_dir, ignore_errors=True)
+            self.finished_at = time.time()
+            self.finished = True
+
+    def _report(self):
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(["source_url", "nap_item_number", "mode", "status", "detail"])
+        with self._lock:
+            for row, status, detail in self.results:
+                writer.writerow([row["source_url"], row["nap_item_number"], row["mode"], status, detail])
+        return out.getvalue()
@@ -0,0 +1,174 @@
+"""
+Drops template CSS rules that cannot match a generated listing.
+
+template.html carries a full framework stylesheet, while a listing only uses
+a few dozen classes and ids. A selector is kept when every class and id it
+requires is in the vocabulary of the page: the template's own markup plus the
+classes / ids the generator creates (image gallery, thumbnails, .compat-grid,
+static links). Tag names, attribute selectors and pseudo-classes never cause
+a rule to be dropped, so the result is conservative.
+
+@media / @supports blocks are pruned recursively and removed when empty;
+@keyframes are kept only while a remaining rule still mentions their name.
+Comments are not carried over.
+"""
+import re
+
+COMMENT_RE = re.compile(r"/\*.*?\*/", re.S)
+SPECIAL_RE = re.compile(r"""[{}"';]""")
+STRING_RE = re.compile(r""""(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*'""")
+BRACKET_RE = re.compile(r"\[[^\[\]]*\]")
+PAREN_RE = re.compile(r"\([^()]*\)")
+TOKEN_RE = re.compile(r"([.#])((?:\\.|[\w-])+)")
+NESTED_AT_RULES = ("media", "supports", "document", "-moz-document", "layer", "container")
+
+class Vocabulary:
+    """
+    Classes and ids that can occur in a generated page. id_pattern matches
+    generated ids that are numbered per listing (gal1, content1, ...).
+    """
+    def __init__(self, classes=(), ids=(), id_pattern=None):
+        self.classes = set(classes)
+        self.ids = set(ids)
+        self.id_pattern = re.compile(id_pattern) if id_pattern else None
+
+    def add_tag(self, tag):
+        self.classes.update(tag.get("class") or [])
+        if tag.get("id"): self.ids.add(tag["id"])
+
+    def has_class(self, name):
+        return name in self.classes
+
+    def has_id(self, name):
+        return name in self.ids or bool(self.id_pattern and self.id_pattern.fullmatch(name))
+
+# ==========================================
+# PARSING
+# ==========================================
+
+def parse_rules(css):
+    """
+    Splits css (without comments) into top-level (prelude, body) pairs.
+    Statements such as @import have body None.
+    """
+    rules = []
+    depth, start, body_start, prelude = 0, 0, 0, ""
+    pos = 0
+    while True:
+        m = SPECIAL_RE.search(css, pos)
+        if not m: break
+        ch, i = m.group(), m.start()
+        pos = i + 1
+        if ch in "\"'":
+            end = STRING_RE.match(css, i)
+            if end: pos = end.end()
+        elif ch == "{":
+            if depth == 0:
+                prelude, body_start = css[start:i].strip(), i + 1
+            depth += 1
+        elif ch == "}":
+            if depth == 0:
+                start = pos  # Stray closing brace
+                continue
+            depth -= 1
+            if depth == 0:
+                rules.append((prelude, css[body_start:i]))
+                start = pos
+        elif depth == 0:
+            statement = css[start:i].strip()
+            if statement: rules.append((statement, None))
+            start = pos
+    if depth == 0 and css[start:].strip():
+        rules.append((css[start:].strip(), None))
+    return rules
+
+def split_selectors(prelude):
+    """
+    Splits a selector list on the commas that are not inside (), [] or strings.
+    """
+    selectors, depth, start, pos = [], 0, 0, 0
+    while pos < len(prelude):
+        ch = prelude[pos]
+        if ch in "\"'":
+            end = STRING_RE.match(prelude, pos)
+            pos = end.end() if end else pos + 1
+            continue
+        if ch in "([": depth += 1
+        elif ch in ")]": depth = max(depth - 1, 0)
+        elif ch == "," and depth == 0:
+            selectors.append(prelude[start:pos].strip())
+            start = pos + 1
+        pos += 1
+    selectors.append(prelude[start:].strip())
+    return [s for s in selectors if s]
+
+def required_tokens(selector):
+    """
+    Returns the ("." | "#", name) pairs an element chain needs for the selector
+    to match. Anything inside (), [] or strings is ignored (e.g. :not(.x)).
+    """
+    bare = BRACKET_RE.sub("", STRING_RE.sub("", selector))
+    while True:
+        stripped = PAREN_RE.sub("", bare)
+        if stripped == bare: break
+        bare = stripped
+    return TOKEN_RE.findall(bare)
+
+# ==========================================
+# PRUNING
+# ==========================================
+
+def selector_can_match(selector, vocabulary):
+    for kind, name in required_tokens(selector):
+        if "\\" in name: continue  # Escaped names are not worth decoding; keep the rule
+        if kind == "." and not vocabulary.has_class(name): return False
+        if kind == "#" and not vocabulary.has_id(name): return False
+    return True
+
+def _prune_rules(rules, vocabulary, dropped):
+    out = []
+    for prelude, body in rules:
+        if body is None:
+            out.append(prelude + ";")
+        elif prelude.startswith("@"):
+            keyword = re.match(r"@([\w-]*)", prelude).group(1).lower()
+            if keyword in NESTED_AT_RULES:
+                inner = _prune_rules(parse_rules(body), vocabulary, dropped)
+                if inner: out.append(prelude + " {\n" + "\n".join(inner) + "\n}")
+            else:
+                out.append(prelude + " {" + body + "}")
+        else:
+            kept = []
+            for selector in split_selectors(prelude):
+                if selector_can_match(selector, vocabulary): kept.append(selector)
+                else: dropped.append(selector)
+            if kept: out.append(", ".join(kept) + " {" + body + "}")
+    return out
+
+def prune_css(css, vocabulary):
+    """
+    Returns (pruned css, dropped selectors).
+    """
+    dropped = []
+    rules = _prune_rules(parse_rules(COMMENT_RE.sub("", css)), vocabulary, dropped)
+
+    # Keyframes survive only if some remaining rule still refers to them
+    kept_text = "\n".join(r for r in rules if not re.match(r"@(-\w+-)?keyframes\b", r))
+    out = []
+    for rule in rules:
+        m = re.match(r"@(?:-\w+-)?keyframes\s+([\w-]+)", rule)
+        if m and not re.search(r"(?<![\w-])" + re.escape(m.group(1)) + r"(?![\w-])", kept_text): continue
+        out.append(rule)
+    return "\n" + "\n".join(out) + "\n", dropped
+
+def dropped_tokens(dropped, vocabulary):
+    """
+    Classes / ids whose absence caused a selector to be dropped. A listing that
+    brings any of them in (e.g. through copied supplier markup) needs the full sheet.
+    """
+    tokens = set()
+    for selector in dropped:
+        for kind, name in required_tokens(selector):
+            if kind == "." and not vocabulary.has_class(name): tokens.add(("class", name))
+            elif kind == "#" and not vocabulary.has_id(name): tokens.add(("id", name))
+    return tokens
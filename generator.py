@@ -0,0 +1,1609 @@
+import http_client
+import page_cache
+import metrics
+import css_prune
+import image_resolver
+from bs4 import BeautifulSoup, Comment, Tag
+from bs4.element import AttributeValueWithCharsetSubstitution, PreformattedString
+from bs4.formatter import HTMLFormatter
+import re
+import soupsieve
+import bisect
+import html
+import functools
+import hashlib
+import itertools
+import json
+import os
+from html.parser import HTMLParser
+
+# ==========================================
+# 1. SHARED NETWORKING & HELPERS
+# ==========================================
+
+# NAP item pages (image grid); bench/load_test.py points this at a local mock server
+EBAY_ITEM_URL = "https://www.ebay.com/itm/{item_id}"
+
+def fetch_url_standard(url, consume=None):
+    """
+    Standard fetcher with explicit UTF-8 encoding handling.
+    Goes through the shared pooled session in http_client (rate limits, retries).
+    With consume, the body is streamed into it and the download stops once it returns True.
+    Raises an http_client.FetchFailure (timeout, blocked, not_found, ...) instead of returning nothing.
+    """
+    if not isinstance(url, str): url = str(url)
+    url = url.strip()
+    response = http_client.get(url, stream=consume is not None)
+    http_client.raise_for_status(response, url)
+    response.encoding = "utf-8"
+    return http_client.read_text(response, consume)
+
+def fetch_page(url, kind=page_cache.KIND_ITEM, consume=None):
+    """
+    fetch_url_standard behind the persistent page cache (when enabled).
+    """
+    cache = page_cache.get_cache()
+    if cache is None: return fetch_url_standard(url, consume)
+    if not isinstance(url, str): url = str(url)
+    return cache.fetch(url.strip(), kind, consume)
+
+# --- Streaming extractors for eBay item pages ---
+# Item pages are several hundred KB, but we only need iframe#desc_ifr and the
+# ux-image-grid buttons. These parsers run on tokenizer events, keep no tree and
+# report done as soon as they have their answer, so the fetch can stop reading.
+
+class _StopParsing(Exception):
+    pass
+
+class EarlyExitParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.done = False
+
+    def feed(self, data):
+        """
+        Feeds a chunk; returns True once the extractor needs no more input.
+        """
+        if self.done: return True
+        try:
+            super().feed(data)
+        except _StopParsing:
+            pass
+        return self.done
+
+    def finish(self):
+        self.done = True
+        raise _StopParsing()
+
+def _has_class(attrs, name):
+    return name in (attrs.get("class") or "").split()
+
+def rewrite_image_src(src):
+    src = src.replace("s-l140", "s-l1600")
+    return re.sub(r's-l\d+', 's-l1600', src)
+
+class IframeUrlExtractor(EarlyExitParser):
+    def __init__(self):
+        super().__init__()
+        self.result = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag != "iframe": return
+        attrs = dict(attrs)
+        if attrs.get("id") == "desc_ifr":
+            self.result = attrs.get("src") or None
+            self.finish()
+
+    handle_startendtag = handle_starttag
+
+class ImageGridExtractor(EarlyExitParser):
+    def __init__(self):
+        super().__init__()
+        self.result = []
+        self.grid_depth = 0      # open <div>s inside the first ux-image-grid
+        self.in_button = False
+        self.button_img_seen = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if not self.grid_depth:
+            if tag == "div" and _has_class(attrs, "ux-image-grid"): self.grid_depth = 1
+            return
+        if tag == "div":
+            self.grid_depth += 1
+        elif tag == "button" and _has_class(attrs, "ux-image-grid-item"):
+            self.in_button, self.button_img_seen = True, False
+        elif tag == "img" and self.in_button and not self.button_img_seen:
+            # Only the first <img> of each button counts
+            self.button_img_seen = True
+            src = attrs.get("src") or attrs.get("data-src")
+            if src and "DOcAAOSw8NplLtwK" not in src:
+                self.result.append(rewrite_image_src(src))
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag == "div" and self.grid_depth: self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if not self.grid_depth: return
+        if tag == "button":
+            self.in_button = False
+        elif tag == "div":
+            self.grid_depth -= 1
+            if not self.grid_depth: self.finish()
+
+def parse_images_from_html(html_content):
+    if not html_content: return []
+    extractor = ImageGridExtractor()
+    extractor.feed(html_content)
+    return extractor.result
+
+def extract_iframe_url(html_content):
+    if not html_content: return None
+    extractor = IframeUrlExtractor()
+    extractor.feed(html_content)
+    return extractor.result
+
+def get_ebay_images(item_id):
+    """ 
+    Scrapes images from eBay. Uses standard fetch (No ScrapingAnt).
+    A page without an image grid gives []; a page that cannot be fetched raises
+    its http_client.FetchFailure.
+    """
+    # print(f"   📸 Scraping images for {item_id}...")
+    url = EBAY_ITEM_URL.format(item_id=item_id)
+    extractor = ImageGridExtractor()
+    with metrics.stage("fetch_nap_page") as info:
+        page = fetch_page(url, page_cache.KIND_ITEM, consume=extractor.feed)
+        info["bytes"] = len(page or "")
+        info["images"] = len(extractor.result)
+    return extractor.result[:6]
+
+def fetch_iframe_html(product_url):
+    """
+    Returns the description iframe HTML. Raises http_client.ParseMiss if the
+    item page has no iframe#desc_ifr, or the FetchFailure of either page.
+    """
+    # print("   📄 Scraping description data...")
+    extractor = IframeUrlExtractor()
+    with metrics.stage("fetch_source_page") as info:
+        page = fetch_page(product_url, page_cache.KIND_ITEM, consume=extractor.feed)
+        info["bytes"] = len(page or "")
+    iframe_url = extractor.result
+    
+    if not iframe_url:
+        raise http_client.ParseMiss(product_url, "could not find description iframe (id='desc_ifr')")
+    
+    # print("   Testing Iframe content...")
+    with metrics.stage("fetch_description") as info:
+        iframe_content = fetch_page(iframe_url, page_cache.KIND_DESCRIPTION)
+        info["bytes"] = len(iframe_content or "")
+    if not iframe_content.strip():
+        raise http_client.ParseMiss(iframe_url, "description iframe is empty")
+    return iframe_content
+
+def fetch_listing_sources(product_url, item_id, verify_images=True):
+    """
+    Fetches the description (item page -> iframe) and the NAP image grid concurrently.
+    With verify_images the gallery URLs are checked (see image_resolver).
+    Returns (data_html, image_urls); raises the http_client.FetchFailure of the
+    first page that could not be had.
+    """
+    images_future = http_client.submit(get_ebay_images, item_id)
+    data_html = fetch_iframe_html(product_url)
+    images = images_future.result()
+    if verify_images: images = image_resolver.resolve_gallery(images)
+    return data_html, images
+
+def inject_compact_table_css(template_soup, mode="Xtreme"):
+    style_tag = template_soup.find("style")
+    if not style_tag:
+        style_tag = template_soup.new_tag("style")
+        if template_soup.head:
+            template_soup.head.append(style_tag)
+        else:
+            template_soup.body.insert(0, style_tag)
+
+    css_code = ""
+    
+    # Base CSS
+    css_code += """
+        .table { width: 100%; border-collapse: collapse; margin-top: 15px; }
+        .table td { 
+            width: 25%; 
+            padding: 8px; 
+            border: 1px solid #eee; 
+            font-size: 14px; 
+        }
+    """
+    
+    # Extra styling declared by the source format (e.g. Carparts zebra striping)
+    css_code += FORMATS.get(mode, SourceFormat).table_css
+
+    if style_tag.string:
+        style_tag.string += css_code
+    else:
+        style_tag.string = css_code
+
+class IndexedTag:
+    __slots__ = ("tag", "first", "end", "raw_first", "raw_end", "position", "end_position")
+
+    def __init__(self, tag, first, raw_first, position):
+        self.tag = tag
+        self.first, self.end = first, None              # range in SubtreeIndex.strings
+        self.raw_first, self.raw_end = raw_first, None  # range in SubtreeIndex.raw
+        self.position, self.end_position = position, None  # descendants: entries[position + 1:end_position]
+
+class SubtreeIndex:
+    """
+    One pre-order pass over a tag's descendants.
+
+    Each descendant Tag gets an IndexedTag holding ranges into two shared lists:
+    the get_text(" ", strip=True) pieces (strings) and the get_text() pieces (raw).
+    Text, "contains a span / h3" and "text contains X" questions about any
+    element are then answered from those ranges instead of re-walking its subtree.
+    """
+    TEXT_TYPES = Tag.MAIN_CONTENT_STRING_TYPES
+
+    def __init__(self, root, skip=None):
+        self.strings = []
+        self.raw = []
+        self.entries = []
+        self.positions = {}   # tag name -> sorted entry positions
+        self.skipped = []     # tags for which skip() was true (their subtree is not indexed)
+        self._by_id = {}
+        self._texts = {}
+        self._occurrences = {}
+
+        stack = [(iter(root.contents), None)]
+        while stack:
+            it, entry = stack[-1]
+            child = next(it, None)
+            if child is None:
+                stack.pop()
+                if entry:
+                    entry.end, entry.raw_end = len(self.strings), len(self.raw)
+                    entry.end_position = len(self.entries)
+                continue
+            if isinstance(child, Tag):
+                if skip and skip(child):
+                    self.skipped.append(child)
+                    continue
+                child_entry = IndexedTag(child, len(self.strings), len(self.raw), len(self.entries))
+                self.positions.setdefault(child.name, []).append(len(self.entries))
+                self.entries.append(child_entry)
+                self._by_id[id(child)] = child_entry
+                stack.append((iter(child.contents), child_entry))
+            elif type(child) in self.TEXT_TYPES:
+                self.raw.append(child)
+                stripped = child.strip()
+                if stripped: self.strings.append(stripped)
+
+    def entry(self, tag):
+        return self._by_id.get(id(tag))
+
+    def text(self, entry, raw=False, separator=None):
+        """
+        Same as entry.tag.get_text(" ", strip=True), or get_text() with raw=True.
+        A separator other than the default joins the same pieces differently.
+        Equal ranges share one join.
+        """
+        if separator is None: separator = "" if raw else " "
+        first, end = (entry.raw_first, entry.raw_end) if raw else (entry.first, entry.end)
+        key = (first, end, raw, separator)
+        text = self._texts.get(key)
+        if text is None:
+            pieces = self.raw if raw else self.strings
+            text = self._texts[key] = separator.join(pieces[first:end])
+        return text
+
+    def first_descendant(self, entry, name):
+        """
+        Entry of the first descendant named name (like tag.find(name)), or None.
+        """
+        positions = self.positions.get(name)
+        if not positions: return None
+        i = bisect.bisect_right(positions, entry.position)
+        if i < len(positions) and positions[i] < entry.end_position:
+            return self.entries[positions[i]]
+        return None
+
+    def has_descendant(self, entry, names):
+        return any(self.first_descendant(entry, name) for name in names)
+
+    def contains(self, entry, needle, raw=False, lower=False, separator=None):
+        """
+        needle in self.text(entry, raw, separator) (optionally lowercased),
+        without building the element's text.
+        """
+        if separator is None: separator = "" if raw else " "
+        key = (needle, raw, lower, separator)
+        if key not in self._occurrences:
+            pieces = self.raw if raw else self.strings
+            if lower: pieces = [p.lower() for p in pieces]
+            offsets, pos = [], 0
+            for p in pieces:
+                offsets.append(pos)
+                pos += len(p) + len(separator)
+            offsets.append(pos)
+            joined = separator.join(pieces)
+            found, i = [], joined.find(needle)
+            while i != -1:
+                found.append(i)
+                i = joined.find(needle, i + 1)
+            self._occurrences[key] = (offsets, found)
+        offsets, found = self._occurrences[key]
+
+        first, end = (entry.raw_first, entry.raw_end) if raw else (entry.first, entry.end)
+        if first == end: return False
+        start, stop = offsets[first], offsets[end] - len(separator)
+        i = bisect.bisect_left(found, start)
+        return i < len(found) and found[i] + len(needle) <= stop
+
+    def iter_named(self, names):
+        for entry in self.entries:
+            if entry.tag.name in names: yield entry
+
+# ==========================================
+# 2. XTREME SPECIFIC LOGIC
+# ==========================================
+
+def is_hidden_span(span):
+    style = span.get("style", "").lower()
+    if "color: rgb(255, 255, 255)" in style or "color: #ffffff" in style or "color: white" in style:
+        return "font-size: 10px" in style or "font-size: 1px" in style
+    return False
+
+def clean_description_xtreme(data_desc_tag):
+    out_soup = BeautifulSoup("", "html.parser")
+    seen_texts = set()
+    out_children = []
+    
+    # --- [NEW] REMOVE UNWANTED HIDDEN SPANS BEFORE PROCESSING ---
+    # Skipped while indexing (so they never count as text or as a nested span),
+    # then removed from the source like before.
+    index = SubtreeIndex(data_desc_tag, skip=lambda t: t.name == "span" and is_hidden_span(t))
+    for bad_span in index.skipped:
+        bad_span.decompose()
+
+    # [FLAG] Track if we have already used the one allowed H3
+    first_header_used = False
+
+    for entry in index.iter_named(("h3", "p", "span", "div")):
+        tag = entry.tag
+        text = index.text(entry)
+        if not text or text in seen_texts:
+            continue
+        seen_texts.add(text)
+
+        # Determine if this element "wants" to be a header
+        is_header_candidate = False
+        has_span = index.first_descendant(entry, "span") is not None
+        inner_h3 = index.first_descendant(entry, "h3")
+        
+        # 1. Check explicit H3 tag (Must NOT have span)
+        if tag.name == "h3" and not has_span:
+            is_header_candidate = True
+        
+        # 2. Check nested H3
+        elif inner_h3:
+             inner_text = index.text(inner_h3)
+             if inner_text and inner_text not in seen_texts:
+                 seen_texts.add(inner_text)
+                 text = inner_text 
+                 is_header_candidate = True
+        
+        # 3. Check length threshold (< 30) AND ensure NO span inside
+        elif len(text) < 30 and not has_span:
+            is_header_candidate = True
+
+        # --- LOGIC TO APPLY TAG TYPE ---
+        if is_header_candidate:
+            if not first_header_used:
+                # FIRST ONE -> H3
+                h = out_soup.new_tag("h3")
+                h.string = text
+                out_children.append(h)
+                first_header_used = True
+            else:
+                # SUBSEQUENT ONES -> P (Bold)
+                p = out_soup.new_tag("p")
+                p.string = text
+                p['style'] = "font-weight: bold;"
+                out_children.append(p)
+        else:
+            # PLAIN TEXT -> P
+            p = out_soup.new_tag("p")
+            p.string = text
+            out_children.append(p)
+
+    return out_children
+
+def extract_compatibility_xtreme(compat_section, template):
+    inner_div = template.new_tag("div")
+    inner_div['class'] = "compat-grid" 
+    current_ul = None
+
+    for child in compat_section.find_all(recursive=False):
+        text = child.get_text(" ", strip=True)
+        if not text: continue
+        
+        if "compatible with the following vehicles" in text.lower():
+            continue
+
+        # --- 1. NESTED LIST CHECK (e.g. <h6><ul>...</ul></h6>) ---
+        internal_list_items = child.find_all("li")
+        if internal_list_items:
+            if current_ul is None:
+                current_ul = template.new_tag("ul")
+                inner_div.append(current_ul)
+            
+            for item in internal_list_items:
+                li_text = item.get_text(" ", strip=True)
+                if li_text:
+                    new_li = template.new_tag("li")
+                    new_li.string = li_text
+                    current_ul.append(new_li)
+            continue
+
+        # --- 2. NESTED PARAGRAPH CHECK (e.g. <h6><p>...</p></h6>) ---
+        internal_paragraphs = child.find_all("p", recursive=False)
+        if internal_paragraphs:
+             if current_ul is None:
+                current_ul = template.new_tag("ul")
+                inner_div.append(current_ul)
+             for p in internal_paragraphs:
+                p_text = p.get_text(" ", strip=True)
+                if p_text:
+                    new_li = template.new_tag("li")
+                    new_li.string = p_text
+                    current_ul.append(new_li)
+             continue
+
+        # --- 3. BRAND DETECTION (Refined) ---
+        is_brand = False
+        
+        # Case 1: H6
+        if child.name == "h6":
+            # If it has NO children tags, it's a Brand (e.g. <h6>Chevrolet</h6>)
+            if not child.find(True):
+                is_brand = True
+            # If it DOES have children (e.g. <h6><font>...</font></h6>)
+            elif len(text) < 30: 
+                is_brand = True
+            else:
+                is_brand = False
+        
+        # Case 2: Specific DIV structure
+        elif (child.name == "div" and child.find("font") and child.find("span") and child.find("b")): 
+            is_brand = True
+        
+        # Case 3: Fallback length check
+        elif len(text) < 12: 
+            is_brand = True
+
+        if is_brand:
+            p = template.new_tag("p")
+            strong = template.new_tag("strong")
+            strong.string = text
+            p.append(strong)
+            inner_div.append(p)
+            current_ul = template.new_tag("ul")
+            inner_div.append(current_ul)
+        else:
+            if current_ul is None:
+                current_ul = template.new_tag("ul")
+                inner_div.append(current_ul)
+            li = template.new_tag("li")
+            li.string = text
+            current_ul.append(li)
+
+    return inner_div
+
+def extract_notes_xtreme(soup):
+    notes = []
+    # Select ALL .table-details blocks
+    all_details = soup.select(".tableinfo .table-details")
+    
+    # Only process the FIRST block ([0]) if it exists
+    if all_details:
+        first_details = all_details[0]
+        for child in first_details.find_all(["p", "div", "span"], recursive=False):
+            child_text = child.get_text(" ", strip=True)
+            if not child_text: continue
+            
+            t_lower = child_text.lower()
+            if "brand new in the box" in t_lower or "quality guaranteed" in t_lower:
+                continue
+            if "compatible with the following vehicles" in t_lower:
+                continue
+
+            notes.append(child_text)
+            
+    return notes
+
+# ==========================================
+# 3. CARPARTS SPECIFIC LOGIC
+# ==========================================
+
+# --- SMART MOJIBAKE REPAIR (UTF-8 Fix) ---
+# Leftover sequences after the re-decode. Matched in a single pass; the
+# alternation keeps this order, so "â€" wins over the longer "â€”"/"â€“"/"â€¦"
+# exactly like the old sequential str.replace chain did.
+MOJIBAKE_REPLACEMENTS = {
+    "â€™": "'", "â€œ": '"', "â€": '"', "â€”": "-", "â€“": "-", "Â": " ", "â€¦": "...",
+}
+MOJIBAKE_RE = re.compile("|".join(re.escape(bad) for bad in MOJIBAKE_REPLACEMENTS))
+# Mis-decoded UTF-8 always contains a lead byte (0xC2-0xF4) read as cp1252/latin1,
+# i.e. one of U+00C2..U+00F4. Text without one comes out of the repair unchanged.
+MOJIBAKE_HINT_RE = re.compile("[\u00c2-\u00f4]")
+
+@functools.lru_cache(maxsize=4096)
+def fix_mojibake(text):
+    if not text: return ""
+    if text.isascii() or not MOJIBAKE_HINT_RE.search(text): return text.strip()
+    try:
+        text = text.encode('cp1252').decode('utf-8')
+    except UnicodeError:
+        try:
+            text = text.encode('latin1').decode('utf-8')
+        except UnicodeError:
+            pass 
+    text = MOJIBAKE_RE.sub(lambda m: MOJIBAKE_REPLACEMENTS[m.group(0)], text)
+    return text.strip()
+
+def clean_description_carparts(soup):
+    out_soup = BeautifulSoup("", "html.parser")
+    raw_nodes = []  # (tag, text) for every generated h3 / p / ul
+    
+    container = soup.find(id="content__right") or soup.find("section", id="content__right") or soup
+    
+    start_node = None
+    for h in container.find_all(["h2", "h1", "h3", "h4"]):
+        if "Description" in h.get_text(strip=True):
+            start_node = h; break
+            
+    if not start_node: return []
+
+    # Text and structure facts for every node after the start header, computed once
+    index = SubtreeIndex(start_node.parent)
+
+    def process_node(node, out):
+        """
+        Appends the generated tags for node to out. Returns True on STOP (a nested <section>).
+        """
+        if node.name is None: return False
+        if node.name == 'section': return True
+        entry = index.entry(node)
+        if ('desc__list' in node.get('class', []) or index.contains(entry, "Terms of Use", raw=True)): return False
+        
+        # [SAFEGUARD] Always Keep "CAPA CERTIFIED"
+        is_capa = index.contains(entry, "capa certified", lower=True)
+        
+        if not is_capa:            
+            # 2. IGNORE SPECIFIC WARNING TEXT
+            if index.contains(entry, "use existing emblem", lower=True): return False
+
+        # Flatten Divs
+        if node.name == 'div' or index.has_descendant(entry, ('ul', 'div', 'p')):
+            for child in list(node.children):
+                if process_node(child, out): return True
+            return False
+            
+        # Lists
+        if node.name == 'ul':
+            new_ul = out_soup.new_tag("ul")
+            for li in node.find_all('li'):
+                li_text = li.text
+                if li_text.strip():
+                    new_li = out_soup.new_tag("li")
+                    new_li.string = fix_mojibake(li_text)
+                    new_ul.append(new_li)
+            if new_ul.contents: out.append((new_ul, None))
+            return False
+            
+        # Headers & Paragraphs
+        if node.name in ['p', 'h3', 'h4', 'h5', 'h6']:
+            
+            # 4. Remove hidden spans (SKUs)
+            for span in node.find_all("span"): span.decompose()
+            
+            txt = fix_mojibake(node.get_text(" ", strip=True))
+            if not txt: return False
+            
+            # 5. Create Tags
+            if node.name in ['h3', 'h4', 'h5', 'h6']:
+                 tag = out_soup.new_tag("h3")
+                 tag.string = txt
+            else:
+                 tag = out_soup.new_tag("p")
+                 if node.find("strong") or node.find("b"):
+                     strong = out_soup.new_tag("strong")
+                     strong.string = txt
+                     tag.append(strong)
+                 else:
+                     tag.string = txt
+                     
+            out.append((tag, txt))
+            
+        return False
+
+    # --- Step A: Collect Raw Nodes ---
+    # A STOP anywhere inside a sibling drops everything that sibling produced
+    for tag in list(start_node.next_siblings):
+        results = []
+        if process_node(tag, results): break
+        raw_nodes.extend(results)
+
+    # --- Step B: Deduplicate Headers ---
+    # A <p> built above holds either plain text or a single <strong> with the same text
+    deduped_nodes = []
+    strong_texts = set()
+    for node, text in raw_nodes:
+        if node.name == 'p' and node.strong:
+            strong_texts.add(text.lower())
+
+    for node, text in raw_nodes:
+        if node.name == 'h3':
+            h3_text = text.lower()
+            # If duplicate exists, skip it UNLESS it is CAPA
+            if h3_text in strong_texts and "capa certified" not in h3_text:
+                continue 
+        deduped_nodes.append((node, text))
+
+    # --- Step C: Final Formatting ---
+    final_nodes = []
+    count = len(deduped_nodes)
+    
+    for i, (node, text) in enumerate(deduped_nodes):
+        if node.name == 'p':
+            # 1. Convert Entirely Bold P -> H3
+            if node.strong:
+                new_h3 = out_soup.new_tag("h3")
+                new_h3.string = text
+                final_nodes.append(new_h3)
+                continue 
+            
+            # 2. Bold "Intro" Paragraphs before Lists
+            if len(text) < 50:
+                if i + 1 < count: 
+                    next_node = deduped_nodes[i+1][0]
+                    if next_node.name == 'ul':
+                        node['style'] = "font-weight: bold;"
+            
+            final_nodes.append(node)
+        else:
+            final_nodes.append(node)
+
+    return final_nodes
+
+def extract_compatibility_carparts(soup, template):
+    inner_div = template.new_tag("div")
+    inner_div['class'] = "compat-grid" 
+    
+    container = soup.find("div", class_="item__list")
+    if not container: return None
+    
+    for block in container.find_all("div", class_="items__list--content"):
+        for child in block.find_all(["p", "ul"], recursive=False):
+            if child.name == "p":
+                new_p = template.new_tag("p")
+                strong = template.new_tag("strong")
+                strong.string = child.get_text(strip=True)
+                new_p.append(strong)
+                inner_div.append(new_p)
+            elif child.name == "ul":
+                new_ul = template.new_tag("ul")
+                for li in child.find_all("li"):
+                    new_li = template.new_tag("li")
+                    new_li.string = li.get_text(" ", strip=True)
+                    new_ul.append(new_li)
+                inner_div.append(new_ul)
+                
+    return inner_div
+
+# ==========================================
+# 4. OUR STORE SPECIFIC LOGIC (UNCHANGED)
+# ==========================================
+
+class OurStoreIndex:
+    """
+    One pass over an Our Store description, shared by the three Our Store extractors:
+    every <p> with its text, the headers of the list-valued specs and the marker
+    paragraphs the description and compatibility sections start from.
+    """
+    LIST_MAPPINGS = {"Part Link Number": "Part Link Number", "OE / OEM Number": "OE / OEM Number", "Parts Includes": "Components"}
+
+    def __init__(self, soup):
+        tree = SubtreeIndex(soup)
+        self.paragraphs = []     # (p, get_text(" ", strip=True)) in document order
+        self.list_headers = []   # (header <p>, spec name) in document order
+        self.warranty_start = None
+        self.description_start = None
+        self.compat_start = None
+
+        for entry in tree.iter_named(("p", "span")):
+            tag = entry.tag
+            matched_key = next((k for k in self.LIST_MAPPINGS if tree.contains(entry, k, separator="")), None)
+            if matched_key:
+                header_node = tag if tag.name == 'p' else tag.find_parent('p')
+                if header_node: self.list_headers.append((header_node, self.LIST_MAPPINGS[matched_key]))
+
+            if tag.name != 'p': continue
+            self.paragraphs.append((tag, tree.text(entry)))
+
+            if self.warranty_start is None and tree.contains(entry, "Warranty Coverage Policy", raw=True):
+                self.warranty_start = tag
+            if self.description_start is None and tree.contains(entry, "Description", raw=True) \
+                    and len(tree.text(entry, raw=True)) < 20:
+                self.description_start = tag
+            if self.compat_start is None and tree.contains(entry, "Compatible with the Following Vehicles", raw=True):
+                self.compat_start = tag
+
+def extract_specs_ourstore(soup, index=None):
+    index = index or OurStoreIndex(soup)
+    specs = {}
+
+    for header_node, spec_name in index.list_headers:
+        next_ul = header_node.find_next_sibling('ul')
+        if next_ul:
+            items = [li.get_text(" ", strip=True) for li in next_ul.find_all('li')]
+            val = ", ".join(items)
+            specs[spec_name] = val
+
+    target_keys = ["Certification", "Anticipated Ship Out Time", "Quantity Sold", "Product Fit", "Replaces OE Number", "Finish", "Recommended Use", "Parts link Number", "Vehicle Body Type", "Color"]
+
+    for p, text in index.paragraphs:
+        if "P65Warnings.ca.gov" in text:
+            clean_text = text.replace("Prop 65 WarningWARNING", "WARNING")
+            clean_text = clean_text.replace("Prop 65 Warning", "").strip()
+            if clean_text.startswith(":"): clean_text = clean_text[1:].strip()
+            specs["Prop 65 Warning"] = clean_text
+            continue
+
+        if ":" in text:
+            parts = text.split(":", 1)
+            key = parts[0].strip()
+            val = parts[1].strip()
+            if key in target_keys and val: 
+                specs[key] = val
+
+    if "Prop 65 Warning" not in specs:
+        specs["Prop 65 Warning"] = "WARNING: This product can expose you to chemicals including Chromium, Lead and lead compounds, Nickel, which is known to the State of California to cause cancer and birth defects or other reproductive harm. For more information go to www.P65Warnings.ca.gov."
+
+    return specs
+
+def clean_description_ourstore(soup_input, index=None):
+    index = index or OurStoreIndex(soup_input)
+    out_soup = BeautifulSoup("", "html.parser")
+    out_children = []
+    
+    start_node = index.warranty_start or index.description_start
+    
+    if not start_node: return []
+
+    stop_keys = ["Certification:", "Anticipated Ship Out Time:", "Quantity Sold:", "Product Fit:", "Replaces OE Number:", "Finish:", "Recommended Use:", "Parts link Number:", "Vehicle Body Type:", "Color:", "Compatible with the Following Vehicles", "Return & Replacement Policy", "Prop 65 Warning", "P65Warnings.ca.gov"]
+    
+    raw_nodes = []
+    for sibling in start_node.next_siblings:
+        if sibling.name is None and not sibling.strip(): continue
+        text = sibling.get_text(" ", strip=True)
+        if not text: continue
+        if any(k in text for k in stop_keys): break
+        raw_nodes.append((sibling, text))
+
+    for elem, text in raw_nodes:
+        is_heading = False
+        if hasattr(elem, 'find'):
+            span = elem.find("span", style=True)
+            if span:
+                style = span['style'].lower()
+                if "font-weight: 700" in style or "font-weight: bold" in style: is_heading = True
+                elif "font-size" in style:
+                    match = re.search(r'font-size:\s*(\d+)pt', style)
+                    if match and int(match.group(1)) >= 13: is_heading = True
+        
+        if is_heading:
+            h3 = out_soup.new_tag("h3")
+            h3.string = text
+            out_children.append(h3)
+        elif elem.name == 'ul':
+            new_ul = out_soup.new_tag("ul")
+            for li in elem.find_all('li'):
+                new_li = out_soup.new_tag("li")
+                new_li.string = li.get_text(" ", strip=True)
+                new_ul.append(new_li)
+            out_children.append(new_ul)
+        else:
+            p = out_soup.new_tag("p")
+            p.string = text
+            out_children.append(p)
+
+    return out_children
+
+def extract_compatibility_ourstore(soup, template, index=None):
+    index = index or OurStoreIndex(soup)
+    inner_div = template.new_tag("div")
+    start_node = index.compat_start
+    if not start_node: return None
+
+    current_ul = None
+    for sibling in start_node.next_siblings:
+        if sibling.name is None: continue 
+        text = sibling.get_text(" ", strip=True)
+        if not text: continue
+        if "Return & Replacement Policy" in text: break
+        
+        is_brand = False
+        if sibling.name == 'ul':
+             first_li = sibling.find("li")
+             if first_li and "font-size: 13pt" in str(first_li):
+                 is_brand = True
+                 text = first_li.get_text(" ", strip=True).replace(":", "")
+
+        if is_brand:
+            p = template.new_tag("p")
+            strong = template.new_tag("strong")
+            strong.string = text
+            p.append(strong)
+            inner_div.append(p)
+            current_ul = template.new_tag("ul")
+            inner_div.append(current_ul)
+        else:
+            if current_ul is None:
+                current_ul = template.new_tag("ul")
+                inner_div.append(current_ul)
+            li = template.new_tag("li")
+            li.string = text
+            current_ul.append(li)
+            
+    return inner_div
+
+# ==========================================
+# 5. SOURCE FORMAT REGISTRY
+# ==========================================
+
+FORMATS = {}
+
+def register_format(cls):
+    FORMATS[cls.name] = cls
+    return cls
+
+class SourceFormat:
+    """
+    A supplier description format. Subclasses declare a fingerprint (regexes
+    checked on the raw HTML, before parsing) and their precompiled selectors;
+    an instance wraps one parsed document and extracts every slot from it.
+    The base class extracts nothing (unknown mode).
+    """
+    name = None
+    fingerprints = ()
+    table_css = ""
+
+    def __init__(self, data, template):
+        self.data = data
+        self.template = template  # Tag factory for new nodes
+
+    @classmethod
+    def score(cls, source_html):
+        return sum(1 for fingerprint in cls.fingerprints if fingerprint.search(source_html))
+
+    def title(self): return None
+    def description(self): return []
+    def table_rows(self): return []
+    def compatibility(self): return None
+    def notes(self): return []
+
+def _class_fingerprint(name):
+    return re.compile(r"""class\s*=\s*["'][^"']*(?<![\w-])""" + re.escape(name) + r"(?![\w-])")
+
+def strip_styles(tag):
+    if hasattr(tag, 'attrs'): tag.attrs = {}
+    for child in tag.find_all(True): child.attrs = {}
+
+@register_format
+class XtremeFormat(SourceFormat):
+    name = "Xtreme"
+    fingerprints = (_class_fingerprint("desc-box"), _class_fingerprint("tableinfo"))
+    TITLE = soupsieve.compile(".title-name h2")
+    DESCRIPTION = soupsieve.compile(".desc-box")
+    TABLE = soupsieve.compile(".tableinfo table")
+    TABLE_DETAILS = soupsieve.compile(".table-details")
+
+    def title(self):
+        title_tag = self.TITLE.select_one(self.data)
+        return title_tag.get_text(strip=True) if title_tag else None
+
+    def description(self):
+        data_desc = self.DESCRIPTION.select_one(self.data)
+        return clean_description_xtreme(data_desc) if data_desc else []
+
+    def table_rows(self):
+        # Standard Copy
+        source_table = self.TABLE.select_one(self.data)
+        if not source_table: return []
+        source_tbody = source_table.find("tbody") or source_table
+        return source_tbody.find_all("tr", recursive=False)
+
+    def compatibility(self):
+        table_details = self.TABLE_DETAILS.select(self.data)
+        return extract_compatibility_xtreme(table_details[-1], self.template) if table_details else None
+
+    def notes(self):
+        return extract_notes_xtreme(self.data)
+
+@register_format
+class CarpartsFormat(SourceFormat):
+    name = "Carparts"
+    fingerprints = (re.compile(r"""id\s*=\s*["']content__right["']"""), _class_fingerprint("eb_title"))
+    TITLE = soupsieve.compile(".eb_title")
+    table_css = """
+        /* HEADERS (Columns 1 & 3): Always bold/darker text */
+        .table tr td:nth-child(1), .table tr td:nth-child(3) {
+            font-weight: bold; color: #333;
+        }
+        
+        /* VALUES (Columns 2 & 4): Normal gray text */
+        .table tr td:nth-child(2), .table tr td:nth-child(4) {
+            color: #555;
+        }
+
+        /* --- ZEBRA STRIPING LOGIC --- */
+        /* ODD ROWS (1, 3, 5...): White Background */
+        .table tr:nth-child(odd) td {
+            background-color: #fff;
+        }
+        
+        /* EVEN ROWS (2, 4, 6...): Light Gray Background */
+        .table tr:nth-child(even) td {
+            background-color: #f2f2f2; 
+        }
+        """
+
+    def title(self):
+        title_tag = self.TITLE.select_one(self.data)
+        return title_tag.get_text(strip=True) if title_tag else None
+
+    def description(self):
+        return clean_description_carparts(self.data)
+
+    def table_rows(self):
+        # Double-Up Logic (4 Columns)
+        s_table = self.data.find(id="content__bottom")
+        if not (s_table and s_table.find("table")): return []
+        all_pairs = []
+        for row in s_table.find("table").find_all("tr"):
+            cells = row.find_all(['td', 'th'])
+            if len(cells) == 2:
+                strip_styles(cells[0])
+                strip_styles(cells[1])
+                all_pairs.append((cells[0], cells[1]))
+
+        # Build NEW rows with 2 pairs per row
+        rows = []
+        for i in range(0, len(all_pairs), 2):
+            new_row = self.template.new_tag("tr")
+            new_row.append(all_pairs[i][0])
+            new_row.append(all_pairs[i][1])
+            if i + 1 < len(all_pairs):
+                new_row.append(all_pairs[i+1][0])
+                new_row.append(all_pairs[i+1][1])
+            else:
+                new_row.append(self.template.new_tag("td"))
+                new_row.append(self.template.new_tag("td"))
+            rows.append(new_row)
+        return rows
+
+    def compatibility(self):
+        return extract_compatibility_carparts(self.data, self.template)
+
+    def notes(self):
+        # Find H2 "Notes" in source
+        extracted_notes = []
+        source_notes_header = self.data.find("h2", string=lambda t: t and "Notes" in t)
+        if not source_notes_header: return extracted_notes
+        curr = source_notes_header.next_sibling
+        while curr:
+            if curr.name == 'div' and 'content__table-wrap' in curr.get('class', []): break
+            if curr.name in ['h2', 'h1', 'section']: break
+
+            if curr.name == 'p':
+                note_text = curr.get_text(strip=True)
+                t_lower = note_text.lower()
+                if "brand new in the box" in t_lower and "quality guaranteed" in t_lower:
+                    curr = curr.next_sibling; continue
+                if note_text:
+                    extracted_notes.append(note_text)
+            curr = curr.next_sibling
+        return extracted_notes
+
+@register_format
+class OurStoreFormat(SourceFormat):
+    name = "Our Store"
+    fingerprints = (re.compile(r"<span[^>]*font-size:\s*28pt"),)
+
+    def __init__(self, data, template):
+        super().__init__(data, template)
+        # The Our Store extractors share one pass over the document
+        self.index = OurStoreIndex(data)
+
+    def title(self):
+        title_tag = self.data.find("span", style=lambda v: v and "font-size: 28pt" in v)
+        return title_tag.get_text(strip=True) if title_tag else None
+
+    def description(self):
+        return clean_description_ourstore(self.data, self.index)
+
+    def table_rows(self):
+        rows = []
+        for key, val in extract_specs_ourstore(self.data, self.index).items():
+            tr = self.template.new_tag("tr")
+            td_key = self.template.new_tag("td")
+            strong = self.template.new_tag("strong")
+            strong.string = key
+            td_key.append(strong)
+            td_val = self.template.new_tag("td")
+            td_val.string = val
+            tr.append(td_key)
+            tr.append(td_val)
+            rows.append(tr)
+        return rows
+
+    def compatibility(self):
+        return extract_compatibility_ourstore(self.data, self.template, self.index)
+
+AUTO_MODE = "Auto"
+DEFAULT_MODE = "Xtreme"
+MODES = list(FORMATS)
+
+def detect_format(source_html):
+    """
+    Returns the name of the format whose fingerprint matches best, or None.
+    Ties go to the format registered first.
+    """
+    best, best_score = None, 0
+    for name, source_format in FORMATS.items():
+        score = source_format.score(source_html)
+        if score > best_score: best, best_score = name, score
+    return best
+
+def resolve_mode(mode, source_html):
+    """
+    Returns mode itself, or for AUTO_MODE the detected format (DEFAULT_MODE if none matches).
+    """
+    if mode != AUTO_MODE: return mode
+    detected = detect_format(source_html or "")
+    if detected is None:
+        metrics.count("format.undetected")
+        return DEFAULT_MODE
+    return detected
+
+# ==========================================
+# 6. UNIFIED MERGE LOGIC
+# ==========================================
+
+STATIC_LINKS_HTML = """
+    <div class="static-links" style="padding-bottom: 10px; font-weight: bold;">
+        <a href="https://www.ebay.com/str/hiveofdeals?_tab=about" target="_blank" 
+           style="font-size: 16px; font-weight: 300; color: var(--ef-blue-tint-100, #0053a0); text-decoration-line: underline; text-decoration-thickness: 0.8px; text-underline-offset: 5px;">
+           Terms of Use
+        </a>
+        <span style="margin: 10px 12px; font-size: 18px">|</span>
+        <a href="https://www.ebay.com/str/hiveofdeals?_tab=about" target="_blank" 
+           style="font-size: 16px; font-weight: 300; color: var(--ef-blue-tint-100, #0053a0); text-decoration-line: underline; text-decoration-thickness: 0.8px; text-underline-offset: 5px;">
+           Warranty Coverage Policy
+        </a>
+    </div>
+    """
+
+# Classes / ids the generator adds to slots (kept when pruning template CSS)
+GENERATED_CLASSES = ["product-image-container", "thumbnails-box", "thumb-label", "compat-grid"]
+GENERATED_ID_PATTERN = r"(gal|content)\d+"
+
+CLASS_ID_ATTR_RE = re.compile(r"""\s(class|id)=(?:"([^"]*)"|'([^']*)')""")
+
+SLOT_PREFIX = "nap-slot:"
+SLOT_RE = re.compile(r"<!--" + re.escape(SLOT_PREFIX) + r"(\w+)-->")
+
+MINIMAL_FORMATTER = HTMLFormatter.REGISTRY["minimal"]
+
+def _start_tag(tag, formatter):
+    """
+    Opening tag as html.unescape() would leave it: values are written raw and
+    only need a quote character they do not contain.
+    """
+    parts = ["<", f"{tag.prefix}:" if tag.prefix else "", tag.name]
+    for key, val in formatter.attributes(tag):
+        if val is None:
+            parts.append(f" {key}")
+            continue
+        if isinstance(val, (list, tuple)): val = " ".join(val)
+        elif isinstance(val, AttributeValueWithCharsetSubstitution): val = val.substitute_encoding("utf-8")
+        else: val = str(val)
+        quote = "'" if '"' in val and "'" not in val else '"'
+        parts.append(f" {key}={quote}{val}{quote}")
+    if tag.is_empty_element: parts.append(formatter.void_element_close_prefix or "")
+    parts.append(">")
+    return "".join(parts)
+
+def _string_piece(node, formatter, parent):
+    # Text is escaped by bs4 and unescaped again, i.e. written as is. Comments,
+    # doctypes and <style>/<script> text skip the escape, so they get the real unescape.
+    if not isinstance(node, PreformattedString):
+        if parent is None or parent.name not in formatter.cdata_containing_tags: return node
+    piece = node.output_ready(formatter)
+    return html.unescape(piece) if "&" in piece else piece
+
+def write_nodes(nodes, write, formatter=MINIMAL_FORMATTER):
+    """
+    Streams detached nodes to write() piece by piece, producing exactly
+    html.unescape(<nodes serialized by bs4>) without building either string.
+    Items that are plain str are taken as already rendered HTML.
+    """
+    for node in nodes:
+        if type(node) is str:
+            write(node)
+        elif not isinstance(node, Tag):
+            write(_string_piece(node, formatter, None))
+        else:
+            # Closing tags are pushed as plain str, which is how they are told apart from nodes
+            stack = [node]
+            while stack:
+                item = stack.pop()
+                if type(item) is str:
+                    write(item)
+                elif isinstance(item, Tag):
+                    if not item.hidden:
+                        write(_start_tag(item, formatter))
+                        if not item.is_empty_element:
+                            stack.append(f"</{item.prefix}:{item.name}>" if item.prefix else f"</{item.name}>")
+                    stack.extend(reversed(item.contents))
+                else:
+                    write(_string_piece(item, formatter, item.parent))
+
+def detach_nodes(nodes):
+    """
+    Takes the nodes out of their source tree (as appending them to the output
+    used to), so later lookups on the source no longer see them.
+    """
+    nodes = list(nodes)
+    for node in nodes:
+        if type(node) is not str: node.extract()
+    return nodes
+
+def render_nodes(nodes):
+    """
+    Serializes nodes exactly like the template would (escape, then unescape).
+    """
+    out = []
+    write_nodes(detach_nodes(nodes), out.append)
+    return "".join(out)
+
+def find_compat_details(template):
+    all_d = template.find_all("div", class_="description")
+    compat_target = next((d for d in all_d if d.find("h4") and "Compatible" in d.find("h4").text), None)
+    if not compat_target: return None
+    return compat_target.find("div", class_="description-details") or compat_target.find("div", class_="description-details-1")
+
+def find_notes_div(template):
+    red_warning = template.find("p", style=lambda s: s and "var(--red)" in s)
+    return red_warning.parent if red_warning else None
+
+class CompiledTemplate:
+    """
+    template.html parsed once. The injection points are replaced by slot markers
+    and the page is kept as static string fragments, so rendering a listing is a join.
+    """
+    def __init__(self, template_str, mode="Xtreme", prune_css=False):
+        template = BeautifulSoup(template_str, "html.parser")
+        inject_compact_table_css(template, mode=mode)
+        self.compile_stylesheet(template, prune_css)
+
+        # Locate every slot before mutating anything
+        targets = {
+            "images": template.find("div", class_="product-image-box"),
+            "title": template.select_one(".title h1"),
+            "description": template.select_one('.middle-right .description-details'),
+            "table": template.select_one("table.table tbody"),
+            "compatibility": find_compat_details(template),
+            "notes": find_notes_div(template),
+        }
+
+        # Original contents, used when a listing has nothing to put in a slot
+        for name, node in targets.items():
+            if node is None: continue
+            marker = Comment(SLOT_PREFIX + name)
+            if name == "notes":
+                # Notes are appended after the existing template paragraphs
+                node.append(marker)
+            else:
+                self.defaults[name] = render_nodes(node.contents)
+                node.append(marker)
+
+        parts = SLOT_RE.split(render_nodes([template]))
+        self.fragments = parts[0::2]
+        self.slot_names = parts[1::2]
+        self.static_links = render_nodes([BeautifulSoup(STATIC_LINKS_HTML, "html.parser")])
+
+    def compile_stylesheet(self, template, prune_css):
+        """
+        Turns the <style> contents into the "stylesheet" slot. With prune_css its
+        default is the stylesheet without the rules this template + mode can never
+        match; the full sheet is kept for listings that bring in a dropped class.
+        """
+        self.full_stylesheet = None
+        self.css_fallback = set()
+        style_tag = template.find("style")
+        css = style_tag.string
+        style_tag.clear()
+        style_tag.append(Comment(SLOT_PREFIX + "stylesheet"))
+        # <style> text is not escaped by bs4, so the page unescape applied to it as is
+        self.defaults = {"stylesheet": html.unescape(css)}
+        if not prune_css: return
+
+        vocabulary = css_prune.Vocabulary(GENERATED_CLASSES, id_pattern=GENERATED_ID_PATTERN)
+        for tag in template.find_all(True):
+            vocabulary.add_tag(tag)
+        for tag in BeautifulSoup(STATIC_LINKS_HTML, "html.parser").find_all(True):
+            vocabulary.add_tag(tag)
+        pruned, dropped = css_prune.prune_css(css, vocabulary)
+        self.full_stylesheet = self.defaults["stylesheet"]
+        self.defaults["stylesheet"] = html.unescape(pruned)
+        self.css_fallback = css_prune.dropped_tokens(dropped, vocabulary)
+
+    def needs_full_stylesheet(self, slots):
+        """
+        True when generated content carries a class / id whose rules were pruned.
+        """
+        if not self.css_fallback: return False
+        for content in slots.values():
+            for piece in ([content] if isinstance(content, str) else content):
+                if isinstance(piece, Tag):
+                    for tag in itertools.chain([piece], piece.find_all(True)):
+                        if tag.get("id") and ("id", tag["id"]) in self.css_fallback: return True
+                        for name in tag.get("class") or []:
+                            if ("class", name) in self.css_fallback: return True
+                elif type(piece) is str:
+                    # Rendered HTML (a text that merely looks like an attribute only costs the pruning)
+                    for kind, double_quoted, single_quoted in CLASS_ID_ATTR_RE.findall(piece):
+                        names = (double_quoted or single_quoted).split() if kind == "class" else [double_quoted or single_quoted]
+                        if any((kind, name) in self.css_fallback for name in names): return True
+        return False
+
+    def has_slot(self, name):
+        return name in self.slot_names
+
+    def render_to(self, slots, write):
+        """
+        Streams the page to write(). A slot holds rendered HTML (str) or a list of
+        detached nodes / str pieces for write_nodes. Returns the characters written.
+        """
+        written = len(self.fragments[0])
+        write(self.fragments[0])
+
+        def counted(piece):
+            nonlocal written
+            written += len(piece)
+            write(piece)
+
+        for name, fragment in zip(self.slot_names, self.fragments[1:]):
+            content = slots.get(name, self.defaults.get(name, ""))
+            if isinstance(content, str): counted(content)
+            else: write_nodes(content, counted)
+            counted(fragment)
+        return written
+
+    def render(self, slots):
+        out = []
+        self.render_to(slots, out.append)
+        return "".join(out)
+
+@functools.lru_cache(maxsize=16)  # A couple of template versions x modes x CSS variants
+def _compile_template(template_str, mode, prune_css):
+    return CompiledTemplate(template_str, mode=mode, prune_css=prune_css)
+
+def compile_template(template_str, mode="Xtreme", prune_css=False):
+    """
+    Cached per (template, mode, prune_css), however the arguments are passed.
+    """
+    return _compile_template(template_str, mode, bool(prune_css))
+
+compile_template.cache_clear = _compile_template.cache_clear
+
+# ==========================================
+# 7. LISTING RECORDS (extract once, render many times)
+# ==========================================
+
+RECORD_VERSION = 1     # Shape of the record dict
+EXTRACTOR_VERSION = 3  # Bump when a change to the extractors changes what they return
+
+# Source files whose content decides how a record is rendered
+RENDER_CODE_FILES = [os.path.abspath(__file__), css_prune.__file__]
+
+def content_hash(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8") if isinstance(part, str) else part)
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def record_hash(record):
+    return content_hash(json.dumps(record, sort_keys=True, ensure_ascii=False, separators=(",", ":")))
+
+@functools.lru_cache(maxsize=1)
+def render_code_version():
+    """
+    Hash of the rendering code (this module, css_prune), so a code change
+    marks every output as stale just like a template change does.
+    """
+    contents = []
+    for path in RENDER_CODE_FILES:
+        with open(path, "rb") as f:
+            contents.append(f.read())
+    return content_hash(*contents)
+
+def render_fingerprint(template_str, prune_css=False):
+    """
+    Identifies everything besides the record that a rendered page depends on.
+    """
+    return content_hash(template_str, render_code_version(), "prune_css" if prune_css else "full_css")
+
+def render_hash(fingerprint, record):
+    """
+    Hash of one output page's inputs; equal hashes mean an identical page.
+    """
+    return content_hash(fingerprint, record_hash(record))
+
+def input_hashes(source_data_html, image_urls, mode):
+    """
+    What extract_record would be given for a listing, as hashes. Equal input
+    hashes mean an identical record, so a refresh can skip parsing.
+    """
+    return {
+        "description": content_hash(source_data_html),
+        "images": content_hash(*image_urls),
+        "mode": mode,
+        "extractor_version": EXTRACTOR_VERSION,
+    }
+
+def changed_inputs(old, new):
+    """
+    Names of the inputs that differ between two input_hashes(); ["new"] if there was no old one.
+    """
+    if old is None: return ["new"]
+    return [name for name in new if old.get(name) != new[name]]
+
+# Groups with at least this many lines are listed compactly (see normalize_fitment)
+COMPACT_FITMENT_MIN_LINES = 20
+# "2014 Toyota Corolla LE Sedan 4-Door", also "2014-2016 Toyota Corolla ..."
+FITMENT_LINE_RE = re.compile(r"^((?:19|20)\d\d)(?:\s*[-–]\s*((?:19|20)\d\d))?\s+(\S.*)$")
+
+def parse_fitment_line(line):
+    """
+    Splits a fitment line into (years, vehicle), or returns None if it is not one.
+    The vehicle is everything after the year(s), as written: make, model and
+    trim are not told apart, since models and makes can be several words
+    ("Grand Cherokee", "Land Rover").
+    """
+    m = FITMENT_LINE_RE.match(line)
+    if not m: return None
+    first, last = int(m.group(1)), int(m.group(2) or m.group(1))
+    if last < first or last - first > 100: return None
+    return list(range(first, last + 1)), m.group(3)
+
+def normalize_fitment(lines):
+    """
+    Merges the years of identical vehicles: [{"vehicle", "years"}, ...] in order of
+    first appearance, years sorted. Lines that are not fitment lines are kept in
+    place as {"line": text}, so nothing is lost.
+    """
+    entries, vehicles = [], {}
+    for line in lines:
+        parsed = parse_fitment_line(line)
+        if parsed is None:
+            entries.append({"line": line})
+            continue
+        years, vehicle = parsed
+        entry = vehicles.get(vehicle)
+        if entry is None:
+            entry = vehicles[vehicle] = {"vehicle": vehicle, "years": set()}
+            entries.append(entry)
+        entry["years"].update(years)
+    for entry in vehicles.values():
+        entry["years"] = sorted(entry["years"])
+    return entries
+
+def year_ranges(years):
+    """
+    [2014, 2015, 2016, 2018] -> "2014-2016, 2018"
+    """
+    runs = []
+    for year in years:
+        if runs and year == runs[-1][1] + 1:
+            runs[-1][1] = year
+        else:
+            runs.append([year, year])
+    return ", ".join(str(a) if a == b else f"{a}-{b}" for a, b in runs)
+
+def fitment_items(vehicles):
+    """
+    One list item per vehicle: "2014-2016, 2018 Toyota Corolla LE Sedan 4-Door".
+    """
+    return [entry["line"] if "line" in entry else f"{year_ranges(entry['years'])} {entry['vehicle']}"
+            for entry in vehicles]
+
+def compatibility_record(c_div):
+    """
+    The compatibility div as data: every extractor builds <p><strong>heading</strong></p>
+    and <ul><li>line</li>...</ul> children, kept as groups in document order.
+    Anything else is kept as rendered HTML. Long groups also get their
+    normalized "vehicles", which is what gets rendered for them.
+    """
+    groups = []
+    for child in c_div.children:
+        if child.name == "p" and child.strong is not None and len(child.contents) == 1:
+            groups.append({"heading": child.get_text(), "lines": None})
+        elif child.name == "ul" and all(li.name == "li" for li in child.contents):
+            lines = [li.get_text() for li in child.contents]
+            if groups and "heading" in groups[-1] and groups[-1]["lines"] is None:
+                groups[-1]["lines"] = lines
+            else:
+                groups.append({"heading": None, "lines": lines})
+        else:
+            groups.append({"html": render_nodes([child])})
+    for group in groups:
+        if len(group.get("lines") or ()) < COMPACT_FITMENT_MIN_LINES: continue
+        vehicles = normalize_fitment(group["lines"])
+        if len(vehicles) < len(group["lines"]): group["vehicles"] = vehicles
+    return {"grid": "compat-grid" in (c_div.get("class") or []), "groups": groups}
+
+def render_compatibility(compatibility):
+    parts = ['<div class="compat-grid">' if compatibility["grid"] else "<div>"]
+    for group in compatibility["groups"]:
+        if "html" in group:
+            parts.append(group["html"])
+            continue
+        # Text goes out as is, like every other text node (see write_nodes)
+        if group["heading"] is not None: parts.append(f"<p><strong>{group['heading']}</strong></p>")
+        lines = fitment_items(group["vehicles"]) if group.get("vehicles") else group["lines"]
+        if lines is not None: parts.append("<ul>" + "".join(f"<li>{line}</li>" for line in lines) + "</ul>")
+    parts.append("</div>")
+    return "".join(parts)
+
+def extract_record(source_data_html, image_urls, mode="Xtreme", source_url=None, nap_item_number=None, laps=None):
+    """
+    Parses the description once and returns the listing record: a JSON-serializable
+    dict with the title, cleaned description fragments, spec table rows,
+    compatibility groups, notes and image URLs. HTML fragments are stored in
+    their final form, so rendering needs no parsing.
+    """
+    laps = laps or metrics.Laps()
+    mode = resolve_mode(mode, source_data_html)
+    template = BeautifulSoup("", "html.parser")  # Tag factory for the generated content
+    data = BeautifulSoup(source_data_html, "html.parser")
+
+    # One extractor object per document (the Our Store one indexes it here)
+    source = FORMATS.get(mode, SourceFormat)(data, template)
+    parse_stage = laps.lap("parse", bytes=len(source_data_html), format=mode)
+    if laps.active:
+        parse_stage["nodes"] = len(data.find_all(True))
+        laps.restart()
+
+    record = {
+        "version": RECORD_VERSION, "extractor_version": EXTRACTOR_VERSION,
+        "source_url": source_url, "nap_item_number": nap_item_number, "mode": mode,
+        "images": list(image_urls or []),
+    }
+
+    # The slots are extracted in page order: taking nodes out of the source
+    # (detach_nodes) can change what the later extractors see
+    title = source.title()
+    record["title"] = str(title) if title else None
+    laps.lap("title")
+
+    cleaned_children = detach_nodes(source.description())
+    record["description"] = [render_nodes([node]) for node in cleaned_children]
+    laps.lap("description", nodes=len(cleaned_children))
+
+    record["table_rows"] = [render_nodes([row]) for row in detach_nodes(source.table_rows())]
+    laps.lap("table")
+
+    c_div = source.compatibility()
+    record["compatibility"] = compatibility_record(c_div) if c_div is not None else None
+    laps.lap("compatibility")
+
+    record["notes"] = [str(note) for note in source.notes()]
+    laps.lap("notes")
+    return record
+
+def gallery_nodes(image_urls):
+    template = BeautifulSoup("", "html.parser")  # Tag factory
+    nodes = []
+    for i, url in enumerate(image_urls):
+        idx = i + 1
+        inp = template.new_tag("input", attrs={"type": "radio", "name": "gal", "id": f"gal{idx}"})
+        if i == 0: inp.attrs["checked"] = ""
+        nodes.append(inp)
+        div = template.new_tag("div", attrs={"id": f"content{idx}", "class": "product-image-container"})
+        div.append(template.new_tag("img", attrs={"src": url}))
+        nodes.append(div)
+
+    thumb_box = template.new_tag("div", attrs={"class": "thumbnails-box"})
+    for i, url in enumerate(image_urls):
+        idx = i + 1
+        lbl = template.new_tag("label", attrs={"for": f"gal{idx}", "class": "thumb-label"})
+        lbl.append(template.new_tag("img", attrs={"src": url.replace("s-l1600", "s-l140")}))
+        thumb_box.append(lbl)
+    nodes.append(thumb_box)
+    return nodes
+
+def record_slots(template_str, record, laps, prune_css=False):
+    """
+    Returns (compiled template, slots) for a listing record.
+    """
+    compiled = compile_template(template_str, record["mode"], prune_css)
+    laps.lap("template")
+    slots = {}
+
+    # --- A. IMAGES (Shared) ---
+    if record["images"] and compiled.has_slot("images"):
+        slots["images"] = gallery_nodes(record["images"])
+    laps.lap("images", count=len(record["images"]))
+
+    # --- B. TITLE / C. DESCRIPTION / D. TABLE ---
+    if record["title"] and compiled.has_slot("title"):
+        slots["title"] = record["title"]
+    if compiled.has_slot("description"):
+        slots["description"] = [compiled.static_links] + record["description"]
+    if compiled.has_slot("table"):
+        slots["table"] = record["table_rows"]
+
+    # --- E. COMPATIBILITY ---
+    if record["compatibility"] is not None and compiled.has_slot("compatibility"):
+        slots["compatibility"] = render_compatibility(record["compatibility"])
+
+    # --- F. NOTES ---
+    if compiled.has_slot("notes"):
+        slots["notes"] = "".join(f"<p>{note}</p>" for note in record["notes"])
+
+    if compiled.needs_full_stylesheet(slots):
+        slots["stylesheet"] = compiled.full_stylesheet
+        metrics.count("css.full_stylesheet")
+    return compiled, slots
+
+def render_record(template_str, record, prune_css=False):
+    laps = metrics.Laps()
+    compiled, slots = record_slots(template_str, record, laps, prune_css)
+    final_html = compiled.render(slots)
+    laps.lap("render", bytes=len(final_html))
+    return final_html
+
+def render_record_to(sink, template_str, record, prune_css=False):
+    """
+    Writes the page for a listing record to a file-like sink. Returns the characters written.
+    """
+    laps = metrics.Laps()
+    compiled, slots = record_slots(template_str, record, laps, prune_css)
+    written = compiled.render_to(slots, sink.write)
+    laps.lap("render", bytes=written)
+    return written
+
+# ==========================================
+# 8. ONE-SHOT MERGE (extract + render)
+# ==========================================
+
+def merge_all_data(template_str, source_data_html, image_urls, mode="Xtreme", prune_css=False):
+    """
+    mode is one of MODES, or AUTO_MODE to pick the format from the source HTML.
+    With prune_css, template CSS rules that cannot match the listing are left out (see css_prune).
+    """
+    record = extract_record(source_data_html, image_urls, mode)
+    return render_record(template_str, record, prune_css)
+
+def merge_all_data_to(sink, template_str, source_data_html, image_urls, mode="Xtreme", prune_css=False):
+    """
+    Same page as merge_all_data, written straight to a file-like sink (anything
+    with write(str)). Returns the number of characters written.
+    """
+    record = extract_record(source_data_html, image_urls, mode)
+    return render_record_to(sink, template_str, record, prune_css)
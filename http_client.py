@@ -0,0 +1,313 @@
+"""
+Shared, connection-pooled HTTP client.
+
+One requests.Session (and its urllib3 pools) is reused for every fetch, so
+repeat requests to ebay.com / ebaydesc.com skip the TCP+TLS handshake. A
+shared thread pool lets independent pages be fetched concurrently.
+
+Every request is paced by a token bucket per host (ebay.com, ebaydesc.com and
+the image CDN have separate budgets), retried with jittered exponential
+backoff on timeouts, dropped connections and 429/5xx answers, and refused
+outright while the host's circuit breaker is open -- after several 403/429s in
+a row we back off for a cooldown instead of digging the hole deeper.
+
+Failures are raised as FetchFailure subclasses whose kind tells them apart:
+"timeout", "blocked", "not_found", "parse_miss" (the page arrived but lacks
+what we need) and "fetch_error" for everything else.
+"""
+import contextvars
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Accept-Encoding": "gzip, deflate, br",
+    "Referer": "https://www.google.com/",
+    "Connection": "keep-alive",
+    "Upgrade-Insecure-Requests": "1"
+}
+DEFAULT_TIMEOUT = (5, 15)  # (connect, read) seconds
+DEFAULT_POOL_SIZE = 16
+DEFAULT_MAX_RETRIES = 3
+
+# Requests per second and burst size, by host suffix (longest match wins)
+DEFAULT_RATE_LIMITS = {
+    "ebay.com": (4, 8),
+    "ebaydesc.com": (10, 20),
+    "ebayimg.com": (20, 40),
+    "": (10, 20),
+}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+THROTTLE_STATUSES = {403, 429}
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 30
+BREAKER_THRESHOLD = 5   # Throttled answers in a row that open a host's circuit
+BREAKER_COOLDOWN = 60
+
+_lock = threading.Lock()
+_session = None
+_executor = None
+_pool_size = DEFAULT_POOL_SIZE
+_max_retries = DEFAULT_MAX_RETRIES
+_rate_limits = dict(DEFAULT_RATE_LIMITS)
+_hosts = {}
+
+def configure(pool_size=DEFAULT_POOL_SIZE, max_retries=DEFAULT_MAX_RETRIES, rate_limits=None):
+    """
+    Sets the connection pool size (per host), the number of fetch threads,
+    retries per request and per-host rate limits ({host suffix: (rate, burst)},
+    merged over DEFAULT_RATE_LIMITS). Call before the first fetch.
+    """
+    global _pool_size, _session, _executor, _max_retries
+    with _lock:
+        _pool_size = pool_size
+        _max_retries = max_retries
+        _rate_limits.clear()
+        _rate_limits.update(DEFAULT_RATE_LIMITS, **(rate_limits or {}))
+        _hosts.clear()
+        if _session is not None:
+            _session.close()
+            _session = None
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+            _executor = None
+
+def get_session():
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                session = requests.Session()
+                session.headers.update(DEFAULT_HEADERS)
+                adapter = HTTPAdapter(pool_connections=_pool_size, pool_maxsize=_pool_size)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=_pool_size, thread_name_prefix="fetch")
+    return _executor
+
+# ==========================================
+# FAILURES
+# ==========================================
+
+class FetchFailure(Exception):
+    kind = "fetch_error"
+
+    def __init__(self, url, detail="", status=None):
+        self.url, self.detail, self.status = url, detail, status
+        super().__init__(f"{self.kind}: {url}" + (f" ({detail})" if detail else ""))
+
+class FetchTimeout(FetchFailure):
+    kind = "timeout"
+
+class Blocked(FetchFailure):
+    kind = "blocked"
+
+class CircuitOpen(Blocked):
+    """
+    Raised without a request while a host's circuit breaker is open.
+    """
+
+class NotFound(FetchFailure):
+    kind = "not_found"
+
+class ParseMiss(FetchFailure):
+    kind = "parse_miss"
+
+def raise_for_status(response, url):
+    """
+    Raises the FetchFailure for a non-200 response (closing it).
+    """
+    code = response.status_code
+    if code == 200: return
+    response.close()
+    if code in (404, 410): raise NotFound(url, f"HTTP {code}", code)
+    if code in THROTTLE_STATUSES or code == 401: raise Blocked(url, f"HTTP {code}", code)
+    raise FetchFailure(url, f"HTTP {code}", code)
+
+def _typed(exc, url):
+    if isinstance(exc, requests.Timeout): return FetchTimeout(url, str(exc))
+    return FetchFailure(url, str(exc))
+
+# ==========================================
+# PER-HOST PACING (token bucket + circuit breaker)
+# ==========================================
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate, self.burst = rate, burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Takes a token, sleeping until it is due. Tokens may go negative, which
+        reserves future slots in arrival order. Returns the seconds waited.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            metrics.count("http.rate_limited")
+            time.sleep(wait)
+        return wait
+
+class CircuitBreaker:
+    """
+    Opens after threshold throttled answers in a row and refuses requests for
+    the cooldown (or the server's Retry-After, if longer). After that, requests
+    flow again, but the first throttled answer re-opens it; a success closes it.
+    """
+    def __init__(self, threshold=None, cooldown=None):
+        self.threshold = threshold or BREAKER_THRESHOLD
+        self.cooldown = BREAKER_COOLDOWN if cooldown is None else cooldown
+        self.failures = 0
+        self.open_until = 0
+        self._lock = threading.Lock()
+
+    def check(self, url):
+        remaining = self.open_until - time.monotonic()
+        if remaining > 0:
+            metrics.count("http.circuit_open")
+            raise CircuitOpen(url, f"host throttled us, paused for another {remaining:.0f}s")
+
+    def record(self, throttled, retry_after=None):
+        with self._lock:
+            if not throttled:
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.open_until = time.monotonic() + max(self.cooldown, retry_after or 0)
+                metrics.count("http.circuit_opened")
+
+def _host_state(host):
+    """
+    Returns (TokenBucket, CircuitBreaker) for host.
+    """
+    state = _hosts.get(host)
+    if state is None:
+        with _lock:
+            state = _hosts.get(host)
+            if state is None:
+                suffix = max((s for s in _rate_limits if host == s or host.endswith("." + s) or not s), key=len)
+                state = _hosts[host] = (TokenBucket(*_rate_limits[suffix]), CircuitBreaker())
+    return state
+
+# ==========================================
+# REQUESTS
+# ==========================================
+
+def retry_after(response):
+    value = response.headers.get("Retry-After")
+    try:
+        return max(float(value), 0) if value else None
+    except ValueError:
+        return None  # HTTP-date form; fall back to our own backoff
+
+def backoff_delay(attempt, hint=None):
+    """
+    Full-jitter exponential backoff, never shorter than the server's Retry-After hint.
+    """
+    delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+    return min(BACKOFF_CAP, max(delay, hint or 0))
+
+def request(method, url, timeout=DEFAULT_TIMEOUT, **kwargs):
+    """
+    Sends a request through the shared session, paced and retried as described
+    above. Returns the final requests.Response, which may still be an error
+    status once the retries are used up (see raise_for_status). Raises
+    FetchTimeout / FetchFailure when no response arrives, CircuitOpen while
+    the host is paused.
+    """
+    limiter, breaker = _host_state(urlsplit(url).hostname or "")
+    for attempt in range(_max_retries + 1):
+        breaker.check(url)
+        limiter.acquire()
+        hint = None
+        try:
+            response = get_session().request(method, url, timeout=timeout, **kwargs)
+        except requests.RequestException as e:
+            failure = _typed(e, url)
+            if attempt == _max_retries: raise failure from e
+        else:
+            hint = retry_after(response)
+            breaker.record(response.status_code in THROTTLE_STATUSES, hint)
+            if response.status_code not in RETRY_STATUSES or attempt == _max_retries: return response
+            response.close()
+        metrics.count("http.retries")
+        time.sleep(backoff_delay(attempt, hint))
+
+def get(url, timeout=DEFAULT_TIMEOUT, **kwargs):
+    """
+    GET through the shared session (see request). Returns the requests.Response.
+    """
+    return request("GET", url, timeout=timeout, **kwargs)
+
+def head(url, timeout=DEFAULT_TIMEOUT, **kwargs):
+    """
+    HEAD through the shared session (see request). Returns the requests.Response.
+    """
+    return request("HEAD", url, timeout=timeout, **kwargs)
+
+def read_text(response, consume=None, chunk_size=16384):
+    """
+    Returns the decoded body. With consume, the body is read incrementally and
+    passed chunk by chunk; once consume returns True the connection is closed
+    and only the part read so far is returned.
+    """
+    try:
+        if consume is None:
+            return response.text
+        chunks = []
+        try:
+            for chunk in response.iter_content(chunk_size=chunk_size, decode_unicode=True):
+                if not chunk: continue
+                chunks.append(chunk)
+                if consume(chunk): break
+        finally:
+            response.close()
+        return "".join(chunks)
+    except requests.RequestException as e:
+        raise _typed(e, response.url) from e
+
+# ==========================================
+# CONCURRENCY
+# ==========================================
+
+def submit(fn, *args, **kwargs):
+    """
+    Runs fn on the shared fetch pool and returns its Future.
+    Only submit leaf work here; a task that waits on other pool tasks can deadlock the pool.
+    The caller's context (e.g. the active metrics run) is carried over to the worker thread.
+    """
+    ctx = contextvars.copy_context()
+    return get_executor().submit(ctx.run, fn, *args, **kwargs)
+
+def map_concurrent(fn, items):
+    """
+    Applies fn to every item on the shared fetch pool, preserving order.
+    """
+    futures = [submit(fn, item) for item in items]
+    return [f.result() for f in futures]
@@ -0,0 +1,114 @@
+"""
+Gallery image verification.
+
+The NAP image grid only shows thumbnails, which are rewritten to s-l1600 on
+the assumption that the full size exists. The resolver checks each candidate
+with a HEAD request (or a one-byte ranged GET where HEAD is refused) over the
+shared pooled client, trying smaller sizes until one answers, so a listing
+never links an image that is not there. Images are checked concurrently.
+
+Results are remembered per eBay image key for the page_cache.KIND_IMAGE TTL:
+in a bounded in-memory LRU for the process and in the page cache file across
+runs.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import http_client
+import metrics
+import page_cache
+
+# Largest first; s-l140 is the grid thumbnail itself, so it nearly always exists
+FALLBACK_SIZES = (1600, 1200, 960, 640, 500, 400, 300, 225, 140)
+IMAGE_KEY_RE = re.compile(r"/images/g/([^/]+)/s-l\d+")
+SIZE_RE = re.compile(r"s-l\d+")
+
+MEMO_SIZE = 4096  # Image keys remembered in memory (the page cache file keeps the rest)
+
+_memo = OrderedDict()  # key -> (resolved url, checked_at), least recently used first
+_memo_lock = threading.Lock()
+
+def image_key(url):
+    m = IMAGE_KEY_RE.search(url)
+    return m.group(1) if m else None
+
+def _memo_get(key, ttl):
+    """
+    Returns (resolved url,) if the key was checked within ttl, else None.
+    """
+    with _memo_lock:
+        entry = _memo.get(key)
+        if entry is None: return None
+        if time.time() - entry[1] >= ttl:
+            del _memo[key]
+            return None
+        _memo.move_to_end(key)
+        return (entry[0],)
+
+def _memo_put(key, resolved, checked_at=None):
+    with _memo_lock:
+        _memo[key] = (resolved, checked_at or time.time())
+        _memo.move_to_end(key)
+        while len(_memo) > MEMO_SIZE:
+            _memo.popitem(last=False)
+
+def probe(url):
+    """
+    True if the image exists, False if the server says it does not, None when
+    the check itself failed (timeout, blocked, ...).
+    """
+    try:
+        response = http_client.head(url, allow_redirects=True)
+        response.close()
+        if response.status_code in (403, 405, 501):
+            response = http_client.get(url, headers={"Range": "bytes=0-0"}, stream=True)
+            response.close()
+    except http_client.FetchFailure:
+        return None
+    metrics.count("images.probes")
+    if response.status_code in (200, 206): return True
+    if response.status_code in (404, 410): return False
+    return None
+
+def resolve_image(url):
+    """
+    Returns the largest existing size of the image, None if no size exists, or
+    url unchanged when it could not be checked (nothing is cached then).
+    """
+    key = image_key(url)
+    if key is None: return url
+    cache = page_cache.get_cache()
+    ttl = (cache.ttls if cache else page_cache.DEFAULT_TTLS).get(page_cache.KIND_IMAGE, 0)
+    stored = _memo_get(key, ttl)
+    if stored is None and cache is not None:
+        stored = cache.get_image(key)
+        if stored is not None: _memo_put(key, *stored)
+    if stored is not None:
+        metrics.count("images.cached")
+        return stored[0]
+
+    resolved = None
+    for size in FALLBACK_SIZES:
+        candidate = SIZE_RE.sub(f"s-l{size}", url)
+        found = probe(candidate)
+        if found is None: return url
+        if found:
+            resolved = candidate
+            break
+    if resolved != url: metrics.count("images.fallback" if resolved else "images.missing")
+    _memo_put(key, resolved)
+    if cache: cache.put_image(key, resolved)
+    return resolved
+
+def resolve_gallery(image_urls):
+    """
+    Verifies the gallery URLs concurrently, keeping their order and dropping
+    images that do not exist in any size. Uses the shared fetch pool, so call
+    it from outside that pool.
+    """
+    if not image_urls: return image_urls
+    with metrics.stage("verify_images", images=len(image_urls)):
+        resolved = http_client.map_concurrent(resolve_image, image_urls)
+    return [url for url in resolved if url]
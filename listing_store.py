@@ -0,0 +1,204 @@
+"""
+Local store of extracted listing records.
+
+A record (generator.extract_record) holds everything needed to render a
+listing -- title, description fragments, spec rows, compatibility groups,
+notes and image URLs -- so a template or CSS change can be applied to the
+whole catalog without fetching or parsing any source page again.
+
+Records live in a SQLite file keyed by (source_url, nap_item_number), one
+JSON document per row. Output pages are named after the NAP item number, so
+the store keeps one current record per NAP item: storing a record drops the
+ones extracted for that item from another source URL. The file also
+remembers, per output page, the hash of the inputs it was rendered from (see
+rerender.py), and per listing, hashes of the fetched pages its record was
+extracted from (see batch.py refresh runs). Records can be exported /
+imported as NDJSON:
+
+    python listing_store.py export catalog.ndjson
+    python listing_store.py import catalog.ndjson
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+DEFAULT_DIR = os.environ.get("NAP_LISTING_STORE_DIR", ".listing_store")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    source_url TEXT NOT NULL,
+    nap_item_number TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    record TEXT NOT NULL,
+    extracted_at REAL NOT NULL,
+    PRIMARY KEY (source_url, nap_item_number)
+);
+CREATE TABLE IF NOT EXISTS renders (
+    out_path TEXT PRIMARY KEY,
+    source_url TEXT NOT NULL,
+    nap_item_number TEXT NOT NULL,
+    render_hash TEXT NOT NULL,
+    rendered_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS inputs (
+    source_url TEXT NOT NULL,
+    nap_item_number TEXT NOT NULL,
+    hashes TEXT NOT NULL,
+    checked_at REAL NOT NULL,
+    changed_at REAL NOT NULL,
+    PRIMARY KEY (source_url, nap_item_number)
+);
+"""
+# 2: one record per nap_item_number (version 1 kept one per source URL as well)
+SCHEMA_VERSION = 2
+
+class ListingStore:
+    def __init__(self, path=DEFAULT_DIR):
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(path, "records.sqlite3"), check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        if self._db.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            # Keep the most recently extracted record of every NAP item
+            self._db.execute(
+                "DELETE FROM records WHERE rowid NOT IN (SELECT rowid FROM records r WHERE r.extracted_at = "
+                "(SELECT MAX(extracted_at) FROM records m WHERE m.nap_item_number = r.nap_item_number) "
+                "GROUP BY nap_item_number)")
+            self._db.execute("DELETE FROM inputs WHERE (source_url, nap_item_number) NOT IN "
+                             "(SELECT source_url, nap_item_number FROM records)")
+            self._db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self._db.commit()
+
+    def put(self, record):
+        """
+        Stores a record under its source_url / nap_item_number, replacing an older
+        one and any record (and input hashes) of the item from another source URL.
+        """
+        if not record.get("source_url") or not record.get("nap_item_number"):
+            raise ValueError("a stored record needs source_url and nap_item_number")
+        with self._lock:
+            for table in ("records", "inputs"):
+                self._db.execute(f"DELETE FROM {table} WHERE nap_item_number = ? AND source_url != ?",
+                                 (str(record["nap_item_number"]), record["source_url"]))
+            self._db.execute(
+                "INSERT OR REPLACE INTO records (source_url, nap_item_number, mode, record, extracted_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (record["source_url"], str(record["nap_item_number"]), record["mode"],
+                 json.dumps(record, ensure_ascii=False, separators=(",", ":")), time.time()))
+            self._db.commit()
+
+    def get(self, source_url, nap_item_number):
+        with self._lock:
+            row = self._db.execute("SELECT record FROM records WHERE source_url = ? AND nap_item_number = ?",
+                                   (source_url, str(nap_item_number))).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def __iter__(self):
+        """
+        Yields every record, in key order.
+        """
+        with self._lock:
+            rows = self._db.execute("SELECT record FROM records ORDER BY source_url, nap_item_number").fetchall()
+        for (text,) in rows:
+            yield json.loads(text)
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def delete(self, source_url, nap_item_number):
+        with self._lock:
+            self._db.execute("DELETE FROM records WHERE source_url = ? AND nap_item_number = ?",
+                             (source_url, str(nap_item_number)))
+            self._db.commit()
+
+    # --- Rendered outputs ---
+
+    def render_hash(self, out_path):
+        """
+        The generator.render_hash the page at out_path was last written with, or None.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT render_hash FROM renders WHERE out_path = ?",
+                                   (os.path.abspath(out_path),)).fetchone()
+        return row[0] if row else None
+
+    def put_render(self, out_path, record, render_hash):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO renders (out_path, source_url, nap_item_number, render_hash, rendered_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (os.path.abspath(out_path), record["source_url"], str(record["nap_item_number"]), render_hash, time.time()))
+            self._db.commit()
+
+    # --- Fetched inputs ---
+
+    def input_hashes(self, source_url, nap_item_number):
+        """
+        The generator.input_hashes the stored record was extracted from, or None.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT hashes FROM inputs WHERE source_url = ? AND nap_item_number = ?",
+                                   (source_url, str(nap_item_number))).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_input_hashes(self, source_url, nap_item_number, hashes, changed=True):
+        """
+        Stores the input hashes of a listing. changed=False only moves checked_at,
+        so changed_at keeps the time the supplier content last changed.
+        """
+        now = time.time()
+        with self._lock:
+            if changed:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO inputs (source_url, nap_item_number, hashes, checked_at, changed_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (source_url, str(nap_item_number), json.dumps(hashes, sort_keys=True), now, now))
+            else:
+                self._db.execute("UPDATE inputs SET checked_at = ? WHERE source_url = ? AND nap_item_number = ?",
+                                 (now, source_url, str(nap_item_number)))
+            self._db.commit()
+
+    # --- NDJSON ---
+
+    def export_ndjson(self, path):
+        count = 0
+        with open(path, "w", encoding="utf-8", newline="\n") as f:
+            for record in self:
+                f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+                count += 1
+        return count
+
+    def import_ndjson(self, path):
+        count = 0
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip(): continue
+                self.put(json.loads(line))
+                count += 1
+        return count
+
+# ==========================================
+# CLI
+# ==========================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export / import stored listing records as NDJSON.")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("path", help="NDJSON file")
+    parser.add_argument("--store-dir", default=DEFAULT_DIR, help="Listing store directory")
+    args = parser.parse_args(argv)
+    store = ListingStore(args.store_dir)
+    if args.command == "export":
+        print(f"Exported {store.export_ndjson(args.path)} records to {args.path}")
+    else:
+        print(f"Imported {store.import_ndjson(args.path)} records from {args.path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
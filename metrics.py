@@ -0,0 +1,140 @@
+"""
+Per-run instrumentation.
+
+A run (one generated listing) collects stage records -- duration plus sizes
+such as bytes fetched, DOM node counts and output bytes -- and counters like
+page-cache hits and misses. The active run lives in a context variable, so
+fetch and merge code can report without threading a metrics object through
+every call. With no active run, stage() and count() do nothing.
+
+Finished runs are logged as one JSON line on the "nap.metrics" logger.
+"""
+import contextlib
+import contextvars
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger("nap.metrics")
+
+_current = contextvars.ContextVar("nap_metrics_run", default=None)
+
+class RunMetrics:
+    def __init__(self, **labels):
+        self.labels = labels
+        self.stages = []      # {"stage": name, "ms": duration, **fields}
+        self.counters = {}
+        self.total_ms = None
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def record(self, name, ms, **fields):
+        entry = dict({"stage": name, "ms": round(ms, 3)}, **fields)
+        with self._lock:
+            self.stages.append(entry)
+        return entry
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def add(self, other):
+        """
+        Folds in a to_dict() from another run (e.g. the render half from a worker process).
+        """
+        with self._lock:
+            self.stages.extend(other.get("stages", []))
+            for name, n in other.get("counters", {}).items():
+                self.counters[name] = self.counters.get(name, 0) + n
+
+    def finish(self):
+        self.total_ms = round((time.perf_counter() - self._started) * 1000, 3)
+
+    def to_dict(self):
+        with self._lock:
+            return dict(self.labels, total_ms=self.total_ms, stages=list(self.stages), counters=dict(self.counters))
+
+@contextlib.contextmanager
+def run(emit=True, **labels):
+    """
+    Makes a new RunMetrics the active run for the block. Logs it on exit unless emit=False.
+    """
+    metrics = RunMetrics(**labels)
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        metrics.finish()
+        _current.reset(token)
+        if emit: emit_record(metrics.to_dict())
+
+def current():
+    return _current.get()
+
+def enabled():
+    return _current.get() is not None
+
+@contextlib.contextmanager
+def stage(name, **fields):
+    """
+    Times the block as a stage of the active run. Yields a dict the block can
+    add size fields to (bytes, nodes, ...).
+    """
+    metrics = _current.get()
+    if metrics is None:
+        yield fields
+        return
+    start = time.perf_counter()
+    try:
+        yield fields
+    finally:
+        metrics.record(name, (time.perf_counter() - start) * 1000, **fields)
+
+class Laps:
+    """
+    Records consecutive stages of one function: each lap() closes the stage
+    that started at the previous lap, so sections need no extra nesting.
+    """
+    def __init__(self):
+        self.metrics = _current.get()
+        self.active = self.metrics is not None
+        self._last = time.perf_counter()
+
+    def lap(self, name, **fields):
+        """
+        Returns the stage record, so sizes that are costly to compute can be
+        added afterwards without counting towards the stage (see restart()).
+        """
+        if not self.active: return {}
+        now = time.perf_counter()
+        entry = self.metrics.record(name, (now - self._last) * 1000, **fields)
+        self._last = now
+        return entry
+
+    def restart(self):
+        self._last = time.perf_counter()
+
+def count(name, n=1):
+    metrics = _current.get()
+    if metrics is not None: metrics.count(name, n)
+
+def emit_record(record):
+    logger.info(json.dumps(record, sort_keys=True))
+
+def aggregate(records):
+    """
+    Sums a list of run dicts into per-stage totals and counters.
+    """
+    stages, counters = {}, {}
+    for record in records:
+        for s in record.get("stages", []):
+            agg = stages.setdefault(s["stage"], {"count": 0, "ms": 0.0, "bytes": 0})
+            agg["count"] += 1
+            agg["ms"] += s["ms"]
+            agg["bytes"] += s.get("bytes", 0)
+        for name, n in record.get("counters", {}).items():
+            counters[name] = counters.get(name, 0) + n
+    for agg in stages.values():
+        agg["ms"] = round(agg["ms"], 3)
+    return {"runs": len(records), "stages": stages, "counters": counters}
@@ -0,0 +1,225 @@
+"""
+Persistent on-disk cache for fetched HTML pages.
+
+Pages are stored zlib-compressed in a SQLite file keyed by URL, together with
+their ETag / Last-Modified validators. Each source kind has its own TTL:
+fresh entries are served without touching the network, stale ones are
+revalidated with a conditional GET. The cache is kept under a byte budget by
+evicting the least recently used pages.
+
+The same file also remembers verified gallery image URLs (see image_resolver),
+keyed by eBay image key.
+"""
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+import http_client
+import metrics
+
+KIND_ITEM = "item"                # eBay item pages (description source + NAP image grid)
+KIND_DESCRIPTION = "description"  # Description iframes (ebaydesc.com)
+KIND_IMAGE = "image"              # Verified gallery image URLs (not pages, no byte budget)
+
+DEFAULT_DIR = os.environ.get("NAP_PAGE_CACHE_DIR", ".page_cache")
+DEFAULT_MAX_BYTES = int(os.environ.get("NAP_PAGE_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+DEFAULT_TTLS = {
+    KIND_ITEM: 6 * 3600,
+    KIND_DESCRIPTION: 24 * 3600,
+    KIND_IMAGE: 7 * 24 * 3600,
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    body BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    fetched_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pages_last_access ON pages (last_access);
+CREATE TABLE IF NOT EXISTS images (
+    key TEXT PRIMARY KEY,
+    url TEXT,
+    checked_at REAL NOT NULL
+);
+"""
+# 2: pages are only stored complete (version 1 kept streamed prefixes)
+SCHEMA_VERSION = 2
+
+class PageCache:
+    def __init__(self, path=DEFAULT_DIR, max_bytes=DEFAULT_MAX_BYTES, ttls=None):
+        os.makedirs(path, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(path, "pages.sqlite3"), check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        if self._db.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            self._db.execute("DELETE FROM pages")
+            self._db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self._db.commit()
+
+    # --- Storage ---
+
+    def get(self, url):
+        """
+        Returns (text, etag, last_modified, fetched_at) or None.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT body, etag, last_modified, fetched_at FROM pages WHERE url = ?", (url,)).fetchone()
+            if not row: return None
+            self._db.execute("UPDATE pages SET last_access = ? WHERE url = ?", (time.time(), url))
+            self._db.commit()
+        body, etag, last_modified, fetched_at = row
+        return zlib.decompress(body).decode("utf-8"), etag, last_modified, fetched_at
+
+    def put(self, url, kind, text, etag=None, last_modified=None):
+        body = zlib.compress(text.encode("utf-8"), 6)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO pages (url, kind, body, size, etag, last_modified, fetched_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, kind, body, len(body), etag, last_modified, now, now))
+            self._evict()
+            self._db.commit()
+
+    def touch_fetched(self, url):
+        with self._lock:
+            now = time.time()
+            self._db.execute("UPDATE pages SET fetched_at = ?, last_access = ? WHERE url = ?", (now, now, url))
+            self._db.commit()
+
+    def _evict(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        if total <= self.max_bytes: return
+        for url, size in self._db.execute("SELECT url, size FROM pages ORDER BY last_access").fetchall():
+            if total <= self.max_bytes: break
+            self._db.execute("DELETE FROM pages WHERE url = ?", (url,))
+            total -= size
+
+    def get_image(self, key):
+        """
+        Returns (url, checked_at) for a verified image key (url None if no size
+        of it exists), or None when it is unknown or older than the image TTL.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT url, checked_at FROM images WHERE key = ?", (key,)).fetchone()
+        if not row or time.time() - row[1] >= self.ttls.get(KIND_IMAGE, 0): return None
+        return row
+
+    def put_image(self, key, url):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO images (key, url, checked_at) VALUES (?, ?, ?)",
+                             (key, url, time.time()))
+            self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM pages")
+            self._db.execute("DELETE FROM images")
+            self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            count, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM pages").fetchone()
+        return {"entries": count, "bytes": total, "max_bytes": self.max_bytes}
+
+    # --- Fetching ---
+
+    def fetch(self, url, kind=KIND_ITEM, consume=None):
+        """
+        Returns the page text for url, from cache when fresh, otherwise via a
+        (conditional) GET. Falls back to a stale copy if the network fails, except
+        when the page is gone (404 / 410); without a copy the http_client.FetchFailure
+        is raised.
+
+        With consume (see http_client.read_text) a fresh download is streamed
+        into it, but read to the end: the same URL is read by other extractors
+        (item pages: description iframe and image grid), so only complete pages
+        are cached.
+        """
+        cached = self.get(url)
+        if cached:
+            text, etag, last_modified, fetched_at = cached
+            if time.time() - fetched_at < self.ttls.get(kind, 0):
+                metrics.count("cache.hit")
+                return self._replay(text, consume)
+
+        headers = {}
+        if cached and cached[1]: headers["If-None-Match"] = cached[1]
+        if cached and cached[2]: headers["If-Modified-Since"] = cached[2]
+
+        try:
+            response = http_client.get(url, headers=headers, stream=consume is not None)
+            if response.status_code == 304 and cached:
+                response.close()
+                metrics.count("cache.revalidated")
+                self.touch_fetched(url)
+                return self._replay(cached[0], consume)
+            http_client.raise_for_status(response, url)
+            response.encoding = "utf-8"
+            text = http_client.read_text(response, None if consume is None else _until_done(consume))
+            metrics.count("cache.miss")
+            self.put(url, kind, text, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+            return text
+        except http_client.FetchFailure as failure:
+            if not cached or isinstance(failure, http_client.NotFound):
+                metrics.count("cache.miss")
+                raise
+        metrics.count("cache.stale")
+        return self._replay(cached[0], consume)
+
+    @staticmethod
+    def _replay(text, consume):
+        if consume is not None: consume(text)
+        return text
+
+def _until_done(consume):
+    """
+    Feeds consume until it is done, but never stops the download.
+    """
+    done = False
+    def feed(chunk):
+        nonlocal done
+        if not done: done = consume(chunk)
+        return False
+    return feed
+
+# ==========================================
+# PROCESS-WIDE CACHE
+# ==========================================
+
+_cache = None
+_config = {"enabled": os.environ.get("NAP_PAGE_CACHE", "1") != "0", "path": DEFAULT_DIR,
+           "max_bytes": DEFAULT_MAX_BYTES, "ttls": None}
+_cache_lock = threading.Lock()
+
+def configure(enabled=True, path=DEFAULT_DIR, max_bytes=DEFAULT_MAX_BYTES, ttls=None):
+    """
+    Sets up the process-wide cache. Call before the first fetch.
+    """
+    global _cache
+    with _cache_lock:
+        _config.update(enabled=enabled, path=path, max_bytes=max_bytes, ttls=ttls)
+        _cache = None
+
+def get_cache():
+    """
+    Returns the process-wide PageCache, or None when caching is disabled.
+    """
+    global _cache
+    if not _config["enabled"]: return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = PageCache(_config["path"], _config["max_bytes"], _config["ttls"])
+    return _cache
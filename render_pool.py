@@ -0,0 +1,140 @@
+"""
+Process pool for the CPU-bound part of generating a listing.
+
+Parsing the description with html.parser and building the page is pure
+Python and holds the GIL, so a thread pool only ever uses one core. A
+RenderPool starts worker processes that each load template.html once and
+compile it for every mode up front; fetched HTML (or a stored listing
+record) is then shipped to them and results come back as futures, which the
+caller can consume in completion order.
+
+Per-task timeouts are enforced inside the worker with SIGALRM (Unix only;
+elsewhere the timeout is ignored). max_tasks_per_child recycles workers to
+cap memory growth over very long batches (Python 3.11+).
+"""
+import os
+import signal
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import metrics
+from generator import MODES, compile_template, extract_record, render_record, render_record_to
+
+class TaskTimeout(Exception):
+    pass
+
+# ==========================================
+# 1. WORKER SIDE
+# ==========================================
+
+_template = None
+_prune_css = False
+_task_timeout = None
+
+def _init_worker(template_path, prune_css, task_timeout):
+    global _template, _prune_css, _task_timeout
+    with open(template_path, "r", encoding="utf-8") as f:
+        _template = f.read()
+    _prune_css = prune_css
+    _task_timeout = task_timeout if hasattr(signal, "SIGALRM") else None
+    if _task_timeout: signal.signal(signal.SIGALRM, _on_timeout)
+    for mode in MODES:
+        compile_template(_template, mode, prune_css)
+
+def _on_timeout(signum, frame):
+    raise TaskTimeout(f"task exceeded {_task_timeout}s")
+
+def _run_with_timeout(fn, *args):
+    if not _task_timeout: return fn(*args)
+    signal.setitimer(signal.ITIMER_REAL, _task_timeout)
+    try:
+        return fn(*args)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+def _write_page(out_path, listing):
+    """
+    Streams the page into a temporary file next to out_path and renames it into
+    place, so readers only ever see the old page or the complete new one.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(out_path)), suffix=".tmp")
+    try:
+        # The "render" stage includes the disk writes
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            render_record_to(f, _template, listing, prune_css=_prune_css)
+        os.replace(tmp_path, out_path)
+    except BaseException:
+        # Timeouts included: the previous page (if any) stays as it was
+        if os.path.exists(tmp_path): os.remove(tmp_path)
+        raise
+
+def _render_file(out_path, data_html, images, mode, source_url, nap_item_number):
+    with metrics.run(emit=False) as run_metrics:
+        listing = extract_record(data_html, images, mode, source_url, nap_item_number)
+        _write_page(out_path, listing)
+    return out_path, listing, run_metrics.to_dict()
+
+def _render_record_file(out_path, listing):
+    with metrics.run(emit=False) as run_metrics:
+        _write_page(out_path, listing)
+    return out_path, run_metrics.to_dict()
+
+def _render_html(data_html, images, mode, source_url, nap_item_number):
+    with metrics.run(emit=False) as run_metrics:
+        listing = extract_record(data_html, images, mode, source_url, nap_item_number)
+        final_html = render_record(_template, listing, prune_css=_prune_css)
+    return final_html, listing, run_metrics.to_dict()
+
+def render_file_task(out_path, data_html, images, mode, source_url=None, nap_item_number=None):
+    """
+    Extracts the listing record and writes its page to out_path.
+    Returns (out_path, listing record, render metrics dict).
+    """
+    return _run_with_timeout(_render_file, out_path, data_html, images, mode, source_url, nap_item_number)
+
+def render_record_file_task(out_path, listing):
+    """
+    Writes the page for a stored listing record (atomically, like every task).
+    Returns (out_path, render metrics dict).
+    """
+    return _run_with_timeout(_render_record_file, out_path, listing)
+
+def render_html_task(data_html, images, mode, source_url=None, nap_item_number=None):
+    """
+    Returns (page HTML, listing record, render metrics dict).
+    """
+    return _run_with_timeout(_render_html, data_html, images, mode, source_url, nap_item_number)
+
+# ==========================================
+# 2. POOL
+# ==========================================
+
+class RenderPool:
+    def __init__(self, template_path, workers=None, task_timeout=None, max_tasks_per_child=None, prune_css=False):
+        options = {}
+        if max_tasks_per_child:
+            if sys.version_info < (3, 11):
+                raise ValueError("max_tasks_per_child needs Python 3.11+")
+            options["max_tasks_per_child"] = max_tasks_per_child
+        self.workers = workers or os.cpu_count() or 1
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                             initargs=(template_path, prune_css, task_timeout), **options)
+
+    def render_file(self, out_path, data_html, images, mode, source_url=None, nap_item_number=None):
+        return self._executor.submit(render_file_task, out_path, data_html, images, mode, source_url, nap_item_number)
+
+    def render_record_file(self, out_path, listing):
+        return self._executor.submit(render_record_file_task, out_path, listing)
+
+    def render_html(self, data_html, images, mode, source_url=None, nap_item_number=None):
+        return self._executor.submit(render_html_task, data_html, images, mode, source_url, nap_item_number)
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self._executor.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown(cancel_futures=exc[0] is not None)
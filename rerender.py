@@ -0,0 +1,107 @@
+"""
+Bulk re-render of stored listings.
+
+After template.html or the rendering code changes, every page can be rebuilt
+from the records in the listing store without fetching or parsing a single
+source page:
+
+    python rerender.py --out-dir output --workers 8
+
+Each output page is remembered with the hash of its inputs -- the record, the
+template, the rendering code and the CSS mode (generator.render_hash). Pages
+whose hash still matches and whose file still exists are skipped, so a rerun
+after an unrelated edit writes nothing. Pages are rendered on a RenderPool
+(one process per core by default) and written atomically.
+"""
+import argparse
+import os
+import sys
+from concurrent.futures import as_completed
+
+import listing_store
+import metrics
+from generator import RECORD_VERSION, render_fingerprint, render_hash
+from render_pool import RenderPool, TaskTimeout
+
+def plan_rerender(store, out_dir, fingerprint, force=False):
+    """
+    Returns (jobs, skipped, outdated): jobs are (out_path, record, render hash)
+    for the pages that need writing, skipped counts the up-to-date ones and
+    outdated lists records stored with an older RECORD_VERSION.
+    """
+    jobs, skipped, outdated = [], 0, []
+    for record in store:
+        if record.get("version") != RECORD_VERSION:
+            outdated.append(record)
+            continue
+        out_path = os.path.join(out_dir, f"{record['nap_item_number']}.html")
+        page_hash = render_hash(fingerprint, record)
+        if not force and store.render_hash(out_path) == page_hash and os.path.exists(out_path):
+            skipped += 1
+            continue
+        jobs.append((out_path, record, page_hash))
+    return jobs, skipped, outdated
+
+def rerender(store, template_path, out_dir, workers=None, prune_css=False, force=False,
+             task_timeout=None, max_tasks_per_child=None, log=print):
+    """
+    Re-renders the stored listings whose output is missing or stale.
+    Returns (written_paths, failures, skipped count).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    with open(template_path, "r", encoding="utf-8") as f:
+        fingerprint = render_fingerprint(f.read(), prune_css)
+    jobs, skipped, outdated = plan_rerender(store, out_dir, fingerprint, force)
+    for record in outdated:
+        log(f"SKIPPED {record.get('nap_item_number')} ({record.get('source_url')}): "
+            f"record version {record.get('version')} needs a fresh batch run")
+
+    written, failures, records = [], [], []
+    if jobs:
+        with RenderPool(template_path, workers=workers, task_timeout=task_timeout,
+                        max_tasks_per_child=max_tasks_per_child, prune_css=prune_css) as pool:
+            futures = {pool.render_record_file(out_path, record): (out_path, record, page_hash)
+                       for out_path, record, page_hash in jobs}
+            for fut in as_completed(futures):
+                out_path, record, page_hash = futures[fut]
+                try:
+                    _, render_record = fut.result()
+                except TaskTimeout as e:
+                    failures.append((record, f"render timeout: {e}"))
+                    continue
+                except Exception as e:
+                    failures.append((record, f"render error: {e}"))
+                    continue
+                store.put_render(out_path, record, page_hash)
+                written.append(out_path)
+                records.append(render_record)
+
+    for record, reason in failures:
+        log(f"FAILED {record['nap_item_number']} ({record['source_url']}): {reason}")
+    log(f"Done: {len(written)} re-rendered, {skipped} up to date, {len(outdated)} outdated, {len(failures)} failed.")
+    summary = metrics.aggregate(records)
+    if summary["stages"]:
+        log("Stage totals: " + ", ".join(f"{name} {agg['ms'] / 1000:.2f}s" for name, agg in summary["stages"].items()))
+    return written, failures, skipped
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Re-render stored listings whose template, code or record changed.")
+    parser.add_argument("--out-dir", default="output", help="Directory of the generated <nap_item_number>.html files")
+    parser.add_argument("--template", default="template.html", help="Path to template.html")
+    parser.add_argument("--store-dir", default=listing_store.DEFAULT_DIR, help="Listing store directory")
+    parser.add_argument("--workers", type=int, default=None, help="Render processes (default: CPU count)")
+    parser.add_argument("--task-timeout", type=float, default=None, help="Seconds a single render may take before it fails")
+    parser.add_argument("--max-tasks-per-child", type=int, default=None, help="Restart each render process after this many listings")
+    parser.add_argument("--prune-css", action="store_true", help="Leave out template CSS rules the listings cannot use")
+    parser.add_argument("--force", action="store_true", help="Re-render every page, even when it is up to date")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    _, failures, _ = rerender(listing_store.ListingStore(args.store_dir), args.template, args.out_dir,
+                              workers=args.workers, prune_css=args.prune_css, force=args.force,
+                              task_timeout=args.task_timeout, max_tasks_per_child=args.max_tasks_per_child)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,385 @@
+"""
+HTTP JSON service for generating listings, for tools that drive the
+generator directly instead of through the Streamlit page.
+
+    python service.py --port 8080 --workers 4 --queue 16
+
+    POST /generate          {"source_url" | "raw_html", "nap_item_number" | "image_urls", "mode"?}
+                            -> 200 {"html", "mode", "images", "ms"}
+    POST /jobs              {"items": [<generate request>, ...]} -> 202 {"job_id", "items", "url"}
+    GET  /jobs/<id>         -> {"status", "total", "done", "failed", "items": [...]}
+    GET  /jobs/<id>/items/<n>  -> the generated page (text/html)
+    GET  /health            -> {"status", "in_flight", "capacity", "jobs"}
+
+Pages are rendered on a RenderPool, whose processes load the template once
+and keep it compiled for every mode. Pages are fetched on the request threads
+(through http_client, with its rate limits and retries). At most workers +
+queue generations are accepted at a time. Beyond that, /generate answers 503
+with Retry-After instead of letting requests pile up. Job items take slots
+from the same budget, --job-concurrency per job at a time, but never the last
+--interactive-slots of them, which are kept for /generate. At most --max-jobs
+jobs run at once; /jobs answers 503 beyond that. Finished job pages are kept
+on disk, not in memory.
+
+Errors come back as {"error": kind, "detail": ...}: 400 for bad requests,
+404 for unknown jobs, 422 for a page without a description (parse_miss),
+502 / 504 for the fetch failures of http_client, and 503 when busy.
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import http_client
+import listing_store
+import metrics
+import page_cache
+from generator import AUTO_MODE, MODES, fetch_iframe_html, fetch_listing_sources, get_ebay_images
+from image_resolver import resolve_gallery
+from render_pool import RenderPool, TaskTimeout
+
+MAX_BODY_BYTES = 20 * 1024 * 1024
+MAX_JOB_ITEMS = 5000
+KEEP_JOBS = 50  # Finished jobs (and their pages) kept for download, oldest dropped first
+
+class ServiceError(Exception):
+    def __init__(self, status, kind, detail="", headers=None):
+        super().__init__(detail or kind)
+        self.status, self.kind, self.detail, self.headers = status, kind, detail, headers or {}
+
+    def to_dict(self):
+        return {"error": self.kind, "detail": self.detail}
+
+FAILURE_STATUS = {"timeout": 504, "parse_miss": 422}
+
+# ==========================================
+# 1. REQUESTS
+# ==========================================
+
+def parse_item(payload):
+    """
+    Validates one generate request; returns it with defaults filled in.
+    """
+    if not isinstance(payload, dict):
+        raise ServiceError(400, "bad_request", "expected a JSON object")
+    item = {name: payload.get(name) for name in ("source_url", "raw_html", "nap_item_number", "image_urls")}
+    item["mode"] = payload.get("mode") or AUTO_MODE
+    for name in ("source_url", "raw_html"):
+        if item[name] is not None and not (isinstance(item[name], str) and item[name].strip()):
+            raise ServiceError(400, "bad_request", f"{name} must be a non-empty string")
+    if not item["source_url"] and not item["raw_html"]:
+        raise ServiceError(400, "bad_request", "source_url or raw_html is required")
+    if not item["nap_item_number"] and item["image_urls"] is None:
+        raise ServiceError(400, "bad_request", "nap_item_number or image_urls is required")
+    if item["image_urls"] is not None and (not isinstance(item["image_urls"], list)
+                                           or not all(isinstance(url, str) for url in item["image_urls"])):
+        raise ServiceError(400, "bad_request", "image_urls must be a list of strings")
+    if item["mode"] != AUTO_MODE and item["mode"] not in MODES:
+        raise ServiceError(400, "bad_request", f"unknown mode {item['mode']!r}; use one of {[AUTO_MODE] + MODES}")
+    if item["nap_item_number"] is not None: item["nap_item_number"] = str(item["nap_item_number"]).strip()
+    return item
+
+# ==========================================
+# 2. SERVICE
+# ==========================================
+
+class Job:
+    def __init__(self, items, job_dir):
+        self.id = uuid.uuid4().hex
+        self.items = items
+        self.dir = job_dir
+        self.results = [{"status": "queued"} for _ in items]
+        self.created_at = time.time()
+        self.finished = False
+        self._lock = threading.Lock()
+
+    def set_result(self, index, result):
+        with self._lock:
+            self.results[index] = result
+
+    def to_dict(self):
+        with self._lock:
+            results = [dict(r) for r in self.results]
+        done = sum(1 for r in results if r["status"] not in ("queued", "running"))
+        return {"job_id": self.id, "status": "finished" if self.finished else "running", "total": len(results),
+                "done": done, "failed": sum(1 for r in results if r["status"] == "failed"), "items": results}
+
+class GenerationService:
+    def __init__(self, template_path, workers=None, queue_size=16, job_concurrency=2, max_jobs=4,
+                 interactive_slots=None, task_timeout=None, prune_css=False, verify_images=True, store=None):
+        self.pool = RenderPool(template_path, workers=workers, task_timeout=task_timeout, prune_css=prune_css)
+        self.capacity = self.pool.workers + queue_size
+        self.job_concurrency = job_concurrency
+        self.max_jobs = max_jobs
+        # Slots jobs may hold at once; the rest are only ever taken by /generate
+        reserved = self.pool.workers if interactive_slots is None else interactive_slots
+        self.job_capacity = max(self.capacity - reserved, 1)
+        self.verify_images = verify_images
+        self.store = store
+        self.jobs = OrderedDict()
+        self.jobs_dir = tempfile.mkdtemp(prefix="nap_service_jobs_")
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._job_slots = threading.BoundedSemaphore(self.job_capacity)
+        self._lock = threading.Lock()
+        self._active = 0
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+        shutil.rmtree(self.jobs_dir, ignore_errors=True)
+
+    def in_flight(self):
+        with self._lock:
+            return self._active
+
+    # --- Generation ---
+
+    def load_sources(self, item):
+        """
+        Returns (data_html, image_urls), fetching whatever the request did not provide.
+        """
+        if not item["raw_html"] and item["image_urls"] is None:
+            return fetch_listing_sources(item["source_url"], item["nap_item_number"], self.verify_images)
+        data_html = item["raw_html"] or fetch_iframe_html(item["source_url"])
+        images = item["image_urls"]
+        if images is None:
+            images = get_ebay_images(item["nap_item_number"])
+            if self.verify_images: images = resolve_gallery(images)
+        return data_html, images
+
+    def generate(self, item, wait=False):
+        """
+        Fetches + renders one item within a slot. Without wait, raises a 503
+        ServiceError right away when every slot is taken. Job items hold one of
+        the job slots around this (see _run_job).
+        """
+        if not self._slots.acquire(blocking=wait):
+            raise ServiceError(503, "busy", f"all {self.capacity} slots are taken", {"Retry-After": "1"})
+        with self._lock:
+            self._active += 1
+        started = time.perf_counter()
+        try:
+            with metrics.run(source_url=item["source_url"], nap_item_number=item["nap_item_number"], mode=item["mode"]) as run_metrics:
+                try:
+                    data_html, images = self.load_sources(item)
+                    html, listing, render_record = self.pool.render_html(
+                        data_html, images, item["mode"], item["source_url"], item["nap_item_number"]).result()
+                except http_client.FetchFailure as e:
+                    raise ServiceError(FAILURE_STATUS.get(e.kind, 502), e.kind, str(e))
+                except TaskTimeout as e:
+                    raise ServiceError(504, "render_timeout", str(e))
+                run_metrics.add(render_record)
+            if self.store is not None and listing["source_url"] and listing["nap_item_number"]:
+                self.store.put(listing)
+            return {"html": html, "mode": listing["mode"], "images": len(listing["images"]),
+                    "ms": round((time.perf_counter() - started) * 1000, 1)}
+        finally:
+            with self._lock:
+                self._active -= 1
+            self._slots.release()
+
+    # --- Jobs ---
+
+    def submit_job(self, items):
+        """
+        Starts a job, or raises a 503 ServiceError when max_jobs are still running.
+        """
+        with self._lock:
+            if sum(1 for job in self.jobs.values() if not job.finished) >= self.max_jobs:
+                raise ServiceError(503, "busy", f"{self.max_jobs} jobs are already running", {"Retry-After": "5"})
+            job = Job(items, os.path.join(self.jobs_dir, uuid.uuid4().hex))
+            os.makedirs(job.dir)
+            self.jobs[job.id] = job
+            self._drop_old_jobs()
+        threading.Thread(target=self._run_job, args=(job,), name=f"job-{job.id[:8]}", daemon=True).start()
+        return job
+
+    def _drop_old_jobs(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[:max(len(finished) - KEEP_JOBS, 0)]:
+            shutil.rmtree(self.jobs.pop(job_id).dir, ignore_errors=True)
+
+    def _run_job(self, job):
+        def one(index):
+            job.set_result(index, {"status": "running"})
+            try:
+                with self._job_slots:
+                    result = self.generate(job.items[index], wait=True)
+                with open(os.path.join(job.dir, f"{index}.html"), "w", encoding="utf-8") as f:
+                    f.write(result.pop("html"))
+            except ServiceError as e:
+                job.set_result(index, dict(status="failed", **e.to_dict()))
+                return
+            except OSError as e:
+                job.set_result(index, {"status": "failed", "error": "write_error", "detail": str(e)})
+                return
+            except Exception as e:
+                job.set_result(index, {"status": "failed", "error": "internal", "detail": str(e)})
+                return
+            job.set_result(index, dict(status="ok", url=f"/jobs/{job.id}/items/{index}", **result))
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.job_concurrency) as executor:
+                list(executor.map(one, range(len(job.items))))
+        finally:
+            # Frees the job's place under max_jobs whatever happened
+            job.finished = True
+
+    def job(self, job_id):
+        with self._lock:
+            job = self.jobs.get(job_id)
+        if job is None: raise ServiceError(404, "not_found", f"no job {job_id}")
+        return job
+
+# ==========================================
+# 3. HTTP
+# ==========================================
+
+class ServiceServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service):
+        super().__init__(address, _Handler)
+        self.service = service
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self._dispatch(self._get)
+
+    def do_POST(self):
+        self._dispatch(self._post)
+
+    def _dispatch(self, route):
+        try:
+            route(self.server.service, self.path.split("?", 1)[0].rstrip("/"))
+        except ServiceError as e:
+            self._send_json(e.status, e.to_dict(), e.headers)
+        except Exception as e:
+            logging.getLogger("nap.service").exception("request failed")
+            self._send_json(500, {"error": "internal", "detail": str(e)})
+
+    def _get(self, service, path):
+        parts = path.strip("/").split("/")
+        if path == "/health":
+            return self._send_json(200, {"status": "ok", "in_flight": service.in_flight(),
+                                         "capacity": service.capacity, "jobs": len(service.jobs)})
+        if len(parts) == 2 and parts[0] == "jobs":
+            return self._send_json(200, service.job(parts[1]).to_dict())
+        if len(parts) == 4 and parts[0] == "jobs" and parts[2] == "items" and parts[3].isdigit():
+            job = service.job(parts[1])
+            page_path = os.path.join(job.dir, f"{int(parts[3])}.html")
+            if not os.path.exists(page_path): raise ServiceError(404, "not_found", "no page for this item (yet)")
+            with open(page_path, "rb") as f:
+                return self._send(200, f.read(), "text/html; charset=utf-8")
+        raise ServiceError(404, "not_found", f"no route for GET {path}")
+
+    def _post(self, service, path):
+        payload = self._read_json()
+        if path == "/generate":
+            return self._send_json(200, service.generate(parse_item(payload)))
+        if path == "/jobs":
+            items = payload.get("items") if isinstance(payload, dict) else None
+            if not isinstance(items, list) or not items:
+                raise ServiceError(400, "bad_request", "items must be a non-empty list")
+            if len(items) > MAX_JOB_ITEMS:
+                raise ServiceError(413, "too_large", f"at most {MAX_JOB_ITEMS} items per job")
+            job = service.submit_job([parse_item(item) for item in items])
+            return self._send_json(202, {"job_id": job.id, "items": len(items), "url": f"/jobs/{job.id}"})
+        raise ServiceError(404, "not_found", f"no route for POST {path}")
+
+    def _read_json(self):
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if not 0 <= length <= MAX_BODY_BYTES:
+            # The body is left unread, so the connection cannot be reused
+            self.close_connection = True
+            close = {"Connection": "close"}
+            if length < 0: raise ServiceError(400, "bad_request", "Content-Length must be a non-negative integer", close)
+            raise ServiceError(413, "too_large", f"body over {MAX_BODY_BYTES} bytes", close)
+        try:
+            return json.loads(self.rfile.read(length) or b"null")
+        except ValueError as e:
+            raise ServiceError(400, "bad_request", f"invalid JSON: {e}")
+
+    def _send_json(self, status, payload, headers=None):
+        self._send(status, json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json", headers)
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.getLogger("nap.service").info("%s %s", self.address_string(), format % args)
+
+# ==========================================
+# 4. CLI
+# ==========================================
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Serve listing generation as a JSON API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--template", default="template.html", help="Path to template.html")
+    parser.add_argument("--workers", type=int, default=None, help="Render processes (default: CPU count)")
+    parser.add_argument("--queue", type=int, default=16, help="Requests allowed to wait for a render process")
+    parser.add_argument("--job-concurrency", type=int, default=2, help="Items of a job generated at a time")
+    parser.add_argument("--max-jobs", type=int, default=4, help="Jobs running at once (more get a 503)")
+    parser.add_argument("--interactive-slots", type=int, default=None,
+                        help="Slots jobs never take, kept for /generate (default: one per render process)")
+    parser.add_argument("--task-timeout", type=float, default=30, help="Seconds a single render may take")
+    parser.add_argument("--prune-css", action="store_true", help="Leave out template CSS rules the listings cannot use")
+    parser.add_argument("--no-verify-images", action="store_true", help="Do not check that gallery image sizes exist")
+    parser.add_argument("--cache-dir", default=page_cache.DEFAULT_DIR, help="On-disk page cache directory")
+    parser.add_argument("--no-cache", action="store_true", help="Always fetch pages from the network")
+    parser.add_argument("--store-dir", default=listing_store.DEFAULT_DIR, help="Where extracted listing records are kept")
+    parser.add_argument("--no-store", action="store_true", help="Do not keep the extracted listing records")
+    parser.add_argument("--metrics-log", help="Append per-request metrics (JSON lines) to this file")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    if args.metrics_log:
+        handler = logging.FileHandler(args.metrics_log, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        metrics.logger.addHandler(handler)
+        metrics.logger.propagate = False
+    page_cache.configure(enabled=not args.no_cache, path=args.cache_dir)
+    service = GenerationService(args.template, workers=args.workers, queue_size=args.queue,
+                                job_concurrency=args.job_concurrency, max_jobs=args.max_jobs,
+                                interactive_slots=args.interactive_slots, task_timeout=args.task_timeout,
+                                prune_css=args.prune_css, verify_images=not args.no_verify_images,
+                                store=None if args.no_store else listing_store.ListingStore(args.store_dir))
+    # Every accepted request can have its page fetches and image checks in flight at once
+    http_client.configure(pool_size=max(service.capacity, 8) * 2)
+    server = ServiceServer((args.host, args.port), service)
+    print(f"Serving on http://{args.host}:{server.server_address[1]} "
+          f"({service.pool.workers} render processes, {service.capacity} slots)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
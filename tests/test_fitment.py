@@ -0,0 +1,31 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generator import COMPACT_FITMENT_MIN_LINES, fitment_items, normalize_fitment, parse_fitment_line, year_ranges
+
+def test_parse_keeps_the_vehicle_as_written():
+    assert parse_fitment_line("2011-2013 Jeep Grand Cherokee Laredo/Limited") == \
+        ([2011, 2012, 2013], "Jeep Grand Cherokee Laredo/Limited")
+    assert parse_fitment_line("2010 Chrysler Town & Country Touring") == ([2010], "Chrysler Town & Country Touring")
+    assert parse_fitment_line("Fits all trims") is None
+
+def test_year_ranges():
+    assert year_ranges([2014, 2015, 2016, 2018]) == "2014-2016, 2018"
+    assert year_ranges([2000, 2007]) == "2000, 2007"
+
+def test_only_identical_vehicles_are_merged():
+    lines = ["2011 Jeep Grand Cherokee Laredo", "2012 Jeep Grand Cherokee Laredo", "2011 Jeep Grand Cherokee Limited",
+             "2022-2023 Jeep Grand Wagoneer Series I", "2010 Chrysler Town & Country Touring",
+             "2011 Chrysler Town & Country Touring", "2012 Land Rover LR2 HSE", "2013 Land Rover LR2 HSE",
+             "Fits all trims", "2015 Jeep Grand Cherokee Laredo"]
+    assert fitment_items(normalize_fitment(lines)) == [
+        "2011-2012, 2015 Jeep Grand Cherokee Laredo", "2011 Jeep Grand Cherokee Limited",
+        "2022-2023 Jeep Grand Wagoneer Series I", "2010-2011 Chrysler Town & Country Touring",
+        "2012-2013 Land Rover LR2 HSE", "Fits all trims"]
+
+def test_every_vehicle_and_year_survives_normalization():
+    lines = [f"{2000 + i % 25} Land Rover Model{i // 25} Trim{i % 7}" for i in range(COMPACT_FITMENT_MIN_LINES * 5)]
+    merged = {(year, entry["vehicle"]) for entry in normalize_fitment(lines) for year in entry["years"]}
+    assert merged == {(int(line[:4]), line[5:]) for line in lines}
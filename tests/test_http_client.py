@@ -0,0 +1,126 @@
+import os
+import sys
+import time
+
+import pytest
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import http_client
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+class FakeSession:
+    """
+    Answers requests from a script of status codes or exceptions to raise; the last one repeats.
+    """
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.calls = 0
+
+    def request(self, method, url, timeout=None, **kwargs):
+        self.calls += 1
+        answer = self.answers.pop(0) if len(self.answers) > 1 else self.answers[0]
+        if isinstance(answer, Exception): raise answer
+        return FakeResponse(answer)
+
+    def close(self):
+        pass
+
+@pytest.fixture
+def session(monkeypatch):
+    http_client.configure(max_retries=2, rate_limits={"": (1000, 1000)})
+    monkeypatch.setattr(http_client, "backoff_delay", lambda attempt, hint=None: 0)
+    def install(*answers):
+        fake = FakeSession(*answers)
+        monkeypatch.setattr(http_client, "_session", fake)
+        return fake
+    yield install
+    http_client.configure()
+
+def test_retries_5xx_until_success(session):
+    fake = session(503, 502, 200)
+    assert http_client.get("https://example.com/a").status_code == 200
+    assert fake.calls == 3
+
+def test_returns_the_last_answer_when_retries_run_out(session):
+    fake = session(500)
+    response = http_client.get("https://example.com/a")
+    assert (response.status_code, fake.calls) == (500, 3)
+    with pytest.raises(http_client.FetchFailure) as info:
+        http_client.raise_for_status(response, "https://example.com/a")
+    assert info.value.kind == "fetch_error" and info.value.status == 500
+
+def test_does_not_retry_other_errors(session):
+    fake = session(404, 200)
+    assert http_client.get("https://example.com/a").status_code == 404
+    assert fake.calls == 1
+
+def test_timeouts_are_retried_then_typed(session):
+    fake = session(requests.ConnectTimeout("slow"))
+    with pytest.raises(http_client.FetchTimeout) as info:
+        http_client.get("https://example.com/a")
+    assert info.value.kind == "timeout" and fake.calls == 3
+    session(requests.ConnectionError("reset"))
+    with pytest.raises(http_client.FetchFailure) as info:
+        http_client.get("https://example.com/a")
+    assert info.value.kind == "fetch_error"
+
+@pytest.mark.parametrize("status, kind", [(404, "not_found"), (410, "not_found"), (403, "blocked"),
+                                          (429, "blocked"), (401, "blocked"), (500, "fetch_error")])
+def test_status_failure_kinds(status, kind):
+    response = FakeResponse(status)
+    with pytest.raises(http_client.FetchFailure) as info:
+        http_client.raise_for_status(response, "https://example.com/a")
+    assert info.value.kind == kind and response.closed
+    assert http_client.raise_for_status(FakeResponse(200), "https://example.com/a") is None
+
+def test_breaker_opens_after_threshold_and_reopens_after_cooldown():
+    breaker = http_client.CircuitBreaker(threshold=3, cooldown=0.05)
+    for _ in range(2):
+        breaker.record(throttled=True)
+    breaker.check("https://example.com/a")  # Still closed below the threshold
+    breaker.record(throttled=True)
+    with pytest.raises(http_client.CircuitOpen) as info:
+        breaker.check("https://example.com/a")
+    assert info.value.kind == "blocked"
+    time.sleep(0.06)
+    breaker.check("https://example.com/a")
+    # The next throttled answer opens it again right away; a success closes it
+    breaker.record(throttled=True)
+    with pytest.raises(http_client.CircuitOpen):
+        breaker.check("https://example.com/a")
+    breaker.record(throttled=False)
+    assert breaker.failures == 0
+
+def test_breaker_honours_a_longer_retry_after():
+    breaker = http_client.CircuitBreaker(threshold=1, cooldown=0)
+    breaker.record(throttled=True, retry_after=30)
+    with pytest.raises(http_client.CircuitOpen):
+        breaker.check("https://example.com/a")
+
+def test_throttled_host_is_refused_without_a_request(session, monkeypatch):
+    monkeypatch.setattr(http_client, "BREAKER_THRESHOLD", 2)
+    fake = session(429)
+    # The retries stop as soon as the second 429 opens the circuit
+    with pytest.raises(http_client.CircuitOpen):
+        http_client.get("https://blocked.example.com/a")
+    assert fake.calls == 2
+    with pytest.raises(http_client.CircuitOpen):
+        http_client.get("https://blocked.example.com/b")
+    assert fake.calls == 2
+    session(200)
+    assert http_client.get("https://other.example.com/a").status_code == 200
+
+def test_token_bucket_paces_beyond_the_burst():
+    bucket = http_client.TokenBucket(rate=100, burst=2)
+    assert bucket.acquire() == 0 and bucket.acquire() == 0
+    assert bucket.acquire() > 0
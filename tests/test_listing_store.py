@@ -0,0 +1,46 @@
+import os
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generator import RECORD_VERSION, render_hash
+from listing_store import ListingStore
+from rerender import plan_rerender
+
+def listing(source_url, nap_item_number="555", title="<h1>Part</h1>"):
+    return {"version": RECORD_VERSION, "source_url": source_url, "nap_item_number": nap_item_number,
+            "mode": "Xtreme", "title": title, "images": []}
+
+def test_put_keeps_one_record_per_nap_item(tmp_path):
+    store = ListingStore(str(tmp_path))
+    store.put(listing("https://www.ebay.com/itm/1", title="old"))
+    store.put_input_hashes("https://www.ebay.com/itm/1", "555", {"mode": "Xtreme"})
+    store.put(listing("https://www.ebay.com/itm/2", title="new"))
+    assert [record["title"] for record in store] == ["new"]
+    assert store.get("https://www.ebay.com/itm/1", "555") is None
+    assert store.input_hashes("https://www.ebay.com/itm/1", "555") is None
+
+def test_rerender_does_not_bring_back_a_superseded_source(tmp_path):
+    store = ListingStore(str(tmp_path / "store"))
+    old, new = listing("https://www.ebay.com/itm/1", title="old"), listing("https://www.ebay.com/itm/2", title="new")
+    store.put(old)
+    store.put(new)
+    out_path = tmp_path / "555.html"
+    out_path.write_text("new page")
+    store.put_render(str(out_path), new, render_hash("fingerprint", new))
+    jobs, skipped, outdated = plan_rerender(store, str(tmp_path), "fingerprint")
+    assert (jobs, skipped, outdated) == ([], 1, [])
+
+def test_opening_an_old_store_keeps_the_newest_record_per_nap_item(tmp_path):
+    store = ListingStore(str(tmp_path))
+    store.put(listing("https://www.ebay.com/itm/1", title="old"))
+    store.put(listing("https://www.ebay.com/itm/9", nap_item_number="999"))
+    # A version 1 store could hold both sources of an item
+    db = sqlite3.connect(os.path.join(str(tmp_path), "records.sqlite3"))
+    db.execute("INSERT INTO records VALUES (?, ?, ?, ?, ?)",
+               ("https://www.ebay.com/itm/2", "555", "Xtreme", '{"title": "new"}', 4102444800))
+    db.execute("PRAGMA user_version = 1")
+    db.commit()
+    db.close()
+    assert sorted(record["title"] for record in ListingStore(str(tmp_path))) == ["<h1>Part</h1>", "new"]
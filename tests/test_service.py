@@ -0,0 +1,92 @@
+import http.client
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import service
+
+TEMPLATE_PATH = os.path.join(ROOT, "template.html")
+PAGE = "<p>Brake pads</p>"
+
+@pytest.fixture
+def svc(monkeypatch):
+    """
+    A service whose "slow" items wait for release to be set instead of fetching.
+    """
+    generation = service.GenerationService(TEMPLATE_PATH, workers=1, queue_size=3, job_concurrency=2, max_jobs=2,
+                                           verify_images=False)
+    release = threading.Event()
+    load_sources = generation.load_sources
+    def fake_load_sources(item):
+        if item["source_url"] == "https://slow": release.wait(10)
+        return load_sources(item)
+    monkeypatch.setattr(generation, "load_sources", fake_load_sources)
+    generation.release = release
+    yield generation
+    release.set()
+    generation.close()
+
+def slow_item():
+    return service.parse_item({"source_url": "https://slow", "raw_html": PAGE, "image_urls": [], "mode": "Xtreme"})
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+
+@pytest.mark.parametrize("payload", [{"raw_html": {"x": 1}, "image_urls": []}, {"source_url": "  ", "image_urls": []},
+                                     {"source_url": 5, "image_urls": []}, {"raw_html": PAGE, "image_urls": "a.jpg"},
+                                     {"raw_html": PAGE}, {"raw_html": PAGE, "image_urls": [], "mode": "Nope"}, []])
+def test_badly_typed_input_is_a_400(payload):
+    with pytest.raises(service.ServiceError) as info:
+        service.parse_item(payload)
+    assert info.value.status == 400
+
+def test_jobs_beyond_max_jobs_get_a_503(svc):
+    jobs = [svc.submit_job([slow_item()]) for _ in range(svc.max_jobs)]
+    with pytest.raises(service.ServiceError) as info:
+        svc.submit_job([slow_item()])
+    assert info.value.status == 503 and "Retry-After" in info.value.headers
+    svc.release.set()
+    wait_for(lambda: all(job.finished for job in jobs))
+    assert svc.submit_job([service.parse_item({"raw_html": PAGE, "image_urls": []})])
+
+def test_generate_keeps_its_slots_while_jobs_run(svc):
+    jobs = [svc.submit_job([slow_item() for _ in range(4)]) for _ in range(svc.max_jobs)]
+    wait_for(lambda: svc.in_flight() == svc.job_capacity)
+    result = svc.generate(service.parse_item({"raw_html": PAGE, "image_urls": [], "mode": "Xtreme"}))
+    assert result["html"].startswith("<html>") and result["mode"] == "Xtreme"
+    svc.release.set()
+    wait_for(lambda: all(job.finished for job in jobs))
+    assert all(job.to_dict()["failed"] == 0 for job in jobs)
+
+def test_a_page_that_cannot_be_written_fails_the_item_not_the_job(svc):
+    job = svc.submit_job([slow_item(), slow_item()])
+    shutil.rmtree(job.dir)
+    svc.release.set()
+    wait_for(lambda: job.finished)
+    assert [item["error"] for item in job.to_dict()["items"]] == ["write_error", "write_error"]
+
+@pytest.mark.parametrize("length, status", [("abc", 400), ("-1", 400), (str(service.MAX_BODY_BYTES + 1), 413)])
+def test_bad_content_length(svc, length, status):
+    server = service.ServiceServer(("127.0.0.1", 0), svc)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=5)
+        connection.putrequest("POST", "/generate")
+        connection.putheader("Content-Length", length)
+        connection.endheaders()
+        response = connection.getresponse()
+        assert response.status == status and json.loads(response.read())["error"]
+    finally:
+        server.shutdown()
+        server.server_close()